@@ -1,12 +1,47 @@
+import canonicaljson
+import hashlib
 import requests
 import json
 import os
 import sys
 
+HASHED_FIELDS = ["category", "source_link", "source", "fine_print"]
+
+def fact_hash(fact):
+    # Must match the version hash the server computes in post_fact.
+    fact = dict(fact)
+    del fact["key"]
+    hashable = {name: fact.pop(name, None) for name in HASHED_FIELDS}
+    hashable.update(fact)
+    return hashlib.sha256(canonicaljson.encode_canonical_json(hashable)).hexdigest()
+
 if __name__ == "__main__":
+    # Usage: postfacts.py [--all] [--deactivate-absent] [import url] < facts.json
+    #
+    # Sends a manifest of key -> hash first and uploads only the facts the
+    # server does not already have. --all skips the manifest and uploads
+    # everything. --deactivate-absent retires active facts in the same
+    # categories whose keys are not among the facts given.
+    args = [x for x in sys.argv[1:] if not x.startswith("--")]
+    flags = {x for x in sys.argv[1:] if x.startswith("--")}
     sess = requests.Session()
     sess.auth = (os.environ["BRATOR_FACTS_USER"], os.environ["BRATOR_FACTS_PW"])
-    endpoint = os.environ.get("BRATOR_FACTS_URL") or sys.argv[1]
+    endpoint = os.environ.get("BRATOR_FACTS_URL") or args[0]
+    manifest_endpoint = os.environ.get("BRATOR_FACTS_MANIFEST_URL") or endpoint.replace("/import/", "/manifest/")
+    facts = json.load(sys.stdin)
+
+    if "--all" not in flags:
+        resp = sess.post(manifest_endpoint, json={
+            "manifest": {fact["key"]: fact_hash(fact) for fact in facts},
+            "deactivate_absent": "--deactivate-absent" in flags,
+            "categories": sorted({fact["category"] for fact in facts if fact.get("category")}),
+        }, allow_redirects=False)
+        resp.raise_for_status()
+        result = resp.json()
+        print(f"{result['unchanged']} unchanged, {len(result['needed'])} to upload, {result['deactivated']} deactivated")
+        needed = set(result["needed"])
+        facts = [fact for fact in facts if fact["key"] in needed]
+
     chunk = []
     def flush():
         resp = sess.post(endpoint, json=chunk, allow_redirects=False)
@@ -17,7 +52,7 @@ if __name__ == "__main__":
         resp.raise_for_status()
         print(chunk[-1]["key"], len(chunk), resp.status_code, len(resp.content), resp.history)
         chunk.clear()
-    for fact in json.load(sys.stdin):
+    for fact in facts:
         chunk.append(fact)
         if len(chunk) == 100:
             flush()
@@ -9,6 +9,10 @@ class QuizConfig(AppConfig):
     def ready(self):
         import brator.quiz.signals  # Imported for side-effects
 
+        from django.apps import apps
+        from . import validation
+        validation.build_registry(apps.get_models(include_auto_created=True))
+
         if settings.HONEYCOMB_API_KEY:
             beeline.init(
                 writekey = settings.HONEYCOMB_API_KEY,
@@ -0,0 +1,65 @@
+import numpy as np
+
+from . import stats
+
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_SEED = 1234
+
+# Coverage of the reported intervals.
+INTERVAL_LEVEL = 0.95
+
+def _interval(samples):
+    alpha = (1 - INTERVAL_LEVEL) / 2
+    low, high = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+    return low, high
+
+def _band(estimate, samples):
+    low, high = _interval(samples)
+    return {"estimate": float(estimate), "low": float(low), "high": float(high)}
+
+def bootstrap_calibration(cells, bin_width, resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED):
+    # cells are (confidence_percent, correct, number of answers). Resampling
+    # n answers with replacement is a multinomial draw over the cells, so
+    # all resamples are drawn as one (resamples x cells) matrix of counts,
+    # and every metric is a matrix product with it.
+    cells = [cell for cell in cells if cell[2]]
+    if not cells:
+        return None
+
+    confidences = np.array([float(conf) for conf, _, _ in cells]) / 100
+    correct = np.array([float(corr) for _, corr, _ in cells])
+    counts = np.array([count for _, _, count in cells])
+    n = counts.sum()
+
+    rng = np.random.default_rng(seed)
+    samples = rng.multinomial(n, counts / n, size=resamples)
+
+    ps = np.clip(confidences, stats.MIN_PROBABILITY, stats.MAX_PROBABILITY)
+    per_answer = {
+        "correct_percent": 100 * correct,
+        "mean_confidence_percent": 100 * confidences,
+        "overconfidence_percent": 100 * (confidences - correct),
+        "brier_score": (confidences - correct) ** 2,
+        "log_score": np.where(correct == 1, np.log(ps), np.log1p(-ps)),
+    }
+    rv = {
+        name: _band(counts @ values / n, samples @ values / n)
+        for name, values in per_answer.items()
+    }
+
+    # The same bins as calibration.get_calibration_curve.
+    bin_lows = sorted({(conf // bin_width) * bin_width for conf, _, _ in cells})
+    bins = np.array([bin_lows.index((conf // bin_width) * bin_width) for conf, _, _ in cells])
+    membership = (bins[:, None] == np.arange(len(bin_lows))[None, :]).astype(float)
+    with np.errstate(invalid="ignore"):
+        rates = 100 * (samples @ (membership * correct[:, None])) / (samples @ membership)
+    low, high = _interval(rates)
+    rv["calibration_curve"] = [
+        {
+            "bin_low": float(bin_low),
+            "correct_percent_low": float(low[i]),
+            "correct_percent_high": float(high[i]),
+        }
+        for i, bin_low in enumerate(bin_lows)
+    ]
+    return rv
@@ -0,0 +1,8 @@
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+def get_or_compute(name, user, version, compute, timeout=CACHE_TIMEOUT):
+    # Results are cached per user and version of whatever they are computed
+    # from, so writing new data invalidates them without touching the cache.
+    return cache.get_or_set(f"quiz:{name}:{user.pk}:{version}", compute, timeout)
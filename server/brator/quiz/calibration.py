@@ -0,0 +1,249 @@
+import collections
+import decimal
+
+import beeline
+import numpy as np
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Floor
+
+from . import bootstrap
+from . import caching
+from . import stats
+from .models import CalibrationBucket, Response, UserCalibration
+
+# Width of the confidence bins of the calibration curve, in percent.
+CURVE_BIN_WIDTH = 10
+
+# An incrementally maintained PMF is reported as inconsistent if it differs
+# from one computed from scratch by more than this.
+PMF_TOLERANCE = 1e-9
+
+def _dump_pmf(pmf):
+    return pmf.astype("<f8").tobytes()
+
+def _pmf_from_histogram(histogram):
+    return stats.trim_pmf(stats.pmf_from_histogram([(conf / 100, n) for conf, n, _ in histogram]), 0)
+
+def load_pmf(calibration):
+    # Returns (pmf, offset); see UserCalibration.pmf.
+    if len(calibration.pmf):
+        return np.frombuffer(calibration.pmf, dtype="<f8"), calibration.pmf_offset
+    return _pmf_from_histogram(get_histogram(calibration.user_id))
+
+@beeline.traced(name="record_calibration")
+def record_response(user, confidence_percent, correct):
+    # Must be called inside the transaction that saves the response. The
+    # user's row is locked, so the buckets need no locking of their own.
+    calibration, _ = UserCalibration.objects.select_for_update().get_or_create(user = user)
+    pmf, offset = load_pmf(calibration)
+    pmf, offset = stats.add_to_pmf(pmf, offset, confidence_percent / 100)
+    UserCalibration.objects.filter(pk = calibration.pk).update(
+        answers = F("answers") + 1,
+        correct_answers = F("correct_answers") + int(correct),
+        confidence_percent_sum = F("confidence_percent_sum") + confidence_percent,
+        pmf = _dump_pmf(pmf),
+        pmf_offset = offset,
+    )
+    updated = CalibrationBucket.objects.filter(
+        user = user,
+        confidence_percent = confidence_percent,
+    ).update(
+        answers = F("answers") + 1,
+        correct_answers = F("correct_answers") + int(correct),
+    )
+    if not updated:
+        CalibrationBucket.objects.create(
+            user = user,
+            confidence_percent = confidence_percent,
+            answers = 1,
+            correct_answers = int(correct),
+        )
+
+def get_lifetime_stats(user):
+    calibration = UserCalibration.objects.filter(user = user).first()
+    if calibration is None:
+        calibration = UserCalibration(user = user)
+    plausibility = None
+    if calibration.answers >= stats.MIN_DATA_POINTS:
+        plausibility = stats.plausibility_from_pmf(*load_pmf(calibration), calibration.correct_answers)
+    return {
+        "number_of_answers": calibration.answers,
+        "number_of_correct_answers": calibration.correct_answers,
+        "expected_correct_answers": calibration.confidence_percent_sum / 100,
+        "plausibility": plausibility,
+    }
+
+def get_answer_count(user):
+    # Changes with every new response, so it versions cached results.
+    return UserCalibration.objects.filter(user = user).values_list("answers", flat=True).first() or 0
+
+def _compute_calibration_curve(user, bin_width):
+    rows = CalibrationBucket.objects.filter(
+        user = user,
+        answers__gt = 0,
+    ).annotate(
+        bin = Floor(F("confidence_percent") / bin_width) * bin_width,
+    ).order_by().values("bin").annotate(
+        n = Sum("answers"),
+        n_correct = Sum("correct_answers"),
+        confidence_sum = Sum(F("confidence_percent") * F("answers")),
+    ).order_by("bin")
+    return [
+        {
+            "bin_low": float(row["bin"]),
+            "bin_high": float(min(row["bin"] + bin_width, 100)),
+            "answers": row["n"],
+            "correct_answers": row["n_correct"],
+            "mean_confidence_percent": float(row["confidence_sum"] / row["n"]),
+            "correct_percent": 100 * row["n_correct"] / row["n"],
+        }
+        for row in rows
+    ]
+
+@beeline.traced(name="get_calibration_curve")
+def get_calibration_curve(user, bin_width=CURVE_BIN_WIDTH):
+    # Stated confidence against the observed rate of correct answers, per
+    # confidence bin.
+    return caching.get_or_compute(
+        f"calibration-curve-{bin_width}",
+        user,
+        get_answer_count(user),
+        lambda: _compute_calibration_curve(user, bin_width),
+    )
+
+@beeline.traced(name="get_calibration_bands")
+def get_calibration_bands(user, bin_width=CURVE_BIN_WIDTH):
+    # Bootstrap intervals for the calibration metrics and curve; None if
+    # the user has no responses.
+    def compute():
+        cells = []
+        for conf, n, n_correct in get_histogram(user):
+            cells.append((conf, True, n_correct))
+            cells.append((conf, False, n - n_correct))
+        return bootstrap.bootstrap_calibration(cells, bin_width)
+
+    return caching.get_or_compute(
+        f"calibration-bands-{bin_width}",
+        user,
+        get_answer_count(user),
+        compute,
+    )
+
+def get_histogram(user):
+    # (confidence_percent, answers, correct answers) for every confidence
+    # level the user has used.
+    return list(CalibrationBucket.objects.filter(
+        user = user,
+        answers__gt = 0,
+    ).order_by("confidence_percent").values_list("confidence_percent", "answers", "correct_answers"))
+
+def compute_histograms(user_ids=None):
+    # The same histograms as get_histogram, computed from the responses.
+    qs = Response.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in = user_ids)
+    rows = qs.order_by().values("user", "confidence_percent").annotate(
+        n = Count("pk"),
+        n_correct = Count("pk", filter = Q(correct = True)),
+    ).values_list("user", "confidence_percent", "n", "n_correct")
+
+    rv = collections.defaultdict(list)
+    for user_id, conf, n, n_correct in rows:
+        rv[user_id].append((conf, n, n_correct))
+    for histogram in rv.values():
+        histogram.sort()
+    return dict(rv)
+
+def _pmf_distance(a, b):
+    (pmf_a, offset_a), (pmf_b, offset_b) = a, b
+    offset = min(offset_a, offset_b)
+    size = max(offset_a + len(pmf_a), offset_b + len(pmf_b)) - offset
+    padded_a = np.zeros(size)
+    padded_a[offset_a - offset:offset_a - offset + len(pmf_a)] = pmf_a
+    padded_b = np.zeros(size)
+    padded_b[offset_b - offset:offset_b - offset + len(pmf_b)] = pmf_b
+    return float(np.abs(padded_a - padded_b).max())
+
+def _totals(histogram):
+    return (
+        sum(n for _, n, _ in histogram),
+        sum(n_correct for _, _, n_correct in histogram),
+        sum((conf * n for conf, n, _ in histogram), decimal.Decimal(0)),
+    )
+
+@beeline.traced(name="rebuild_calibration")
+@transaction.atomic
+def rebuild(user_ids=None):
+    histograms = compute_histograms(user_ids)
+
+    calibrations = UserCalibration.objects.all()
+    buckets = CalibrationBucket.objects.all()
+    if user_ids is not None:
+        calibrations = calibrations.filter(user_id__in = user_ids)
+        buckets = buckets.filter(user_id__in = user_ids)
+    calibrations.delete()
+    buckets.delete()
+
+    new_calibrations = []
+    new_buckets = []
+    for user_id, histogram in histograms.items():
+        answers, correct_answers, confidence_percent_sum = _totals(histogram)
+        pmf, offset = _pmf_from_histogram(histogram)
+        new_calibrations.append(UserCalibration(
+            user_id = user_id,
+            answers = answers,
+            correct_answers = correct_answers,
+            confidence_percent_sum = confidence_percent_sum,
+            pmf = _dump_pmf(pmf),
+            pmf_offset = offset,
+        ))
+        new_buckets.extend(
+            CalibrationBucket(
+                user_id = user_id,
+                confidence_percent = conf,
+                answers = n,
+                correct_answers = n_correct,
+            )
+            for conf, n, n_correct in histogram
+        )
+    UserCalibration.objects.bulk_create(new_calibrations, batch_size=1000)
+    CalibrationBucket.objects.bulk_create(new_buckets, batch_size=1000)
+    return len(new_calibrations)
+
+@beeline.traced(name="check_calibration")
+def check(user_ids=None):
+    # Returns (user id, description) for every user whose stored aggregates
+    # disagree with the responses.
+    expected = compute_histograms(user_ids)
+
+    stored = collections.defaultdict(list)
+    buckets = CalibrationBucket.objects.filter(answers__gt = 0)
+    calibrations = UserCalibration.objects.all()
+    if user_ids is not None:
+        buckets = buckets.filter(user_id__in = user_ids)
+        calibrations = calibrations.filter(user_id__in = user_ids)
+    for user_id, conf, n, n_correct in buckets.order_by("user", "confidence_percent").values_list(
+        "user", "confidence_percent", "answers", "correct_answers",
+    ):
+        stored[user_id].append((conf, n, n_correct))
+    totals = {}
+    pmfs = {}
+    for row in calibrations:
+        totals[row.user_id] = (row.answers, row.correct_answers, row.confidence_percent_sum)
+        pmfs[row.user_id] = load_pmf(row)
+
+    rv = []
+    for user_id in sorted(set(expected) | set(stored) | set(totals)):
+        histogram = expected.get(user_id, [])
+        if stored.get(user_id, []) != histogram:
+            rv.append((user_id, f"histogram is {stored.get(user_id, [])}, expected {histogram}"))
+        expected_totals = _totals(histogram)
+        if totals.get(user_id, (0, 0, 0)) != expected_totals:
+            rv.append((user_id, f"totals are {totals.get(user_id)}, expected {expected_totals}"))
+        if user_id in pmfs:
+            error = _pmf_distance(pmfs[user_id], _pmf_from_histogram(histogram))
+            if error > PMF_TOLERANCE:
+                rv.append((user_id, f"PMF is off by {error:.1e}"))
+    return rv
@@ -0,0 +1,120 @@
+import numpy as np
+
+# Long series are downsampled to this many points.
+CHART_MAX_POINTS = 200
+
+def lttb(xs, ys, n_out):
+    # Largest-Triangle-Three-Buckets: returns the indices of n_out points
+    # that keep the visual shape of the series. ys may hold several series
+    # as columns; they share the chosen points.
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float).reshape(len(xs), -1)
+    n = len(xs)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # The first and last points are always kept; the rest are split into
+    # n_out - 2 buckets, each contributing the point forming the largest
+    # triangle with the previously chosen point and the next bucket's mean.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    rv = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = xs[end:edges[i + 2]].mean()
+            next_y = ys[end:edges[i + 2]].mean(axis=0)
+        else:
+            next_x = xs[-1]
+            next_y = ys[-1]
+        areas = np.abs(
+            (xs[a] - next_x) * (ys[start:end] - ys[a])
+            - (xs[a] - xs[start:end])[:, None] * (next_y - ys[a])
+        ).sum(axis=1)
+        a = start + int(areas.argmax())
+        rv.append(a)
+    rv.append(n - 1)
+    return np.array(rv)
+
+def calibration_chart_data(rows, title, max_points=CHART_MAX_POINTS):
+    # rows are (timestamp, P(fewer), P(same), P(more)) in time order.
+    xs = [row[0].timestamp() for row in rows]
+    ys = [[float(x) for x in row[1:]] for row in rows]
+    rows = [rows[i] for i in lttb(xs, ys, max_points)]
+
+    return {
+	"type": "line",
+	"data": {
+                "labels": [row[0].strftime("%Y-%m-%d %H:%M") for row in rows],
+		"datasets": [
+                    {
+                        "label": "Fewer (underconfident)",
+			"data": [row[1] for row in rows],
+                        "borderColor": "#ffaaaa",
+                        "backgroundColor": "#ee9999",
+                    },
+                    {
+                        "label": "Same (calibrated)",
+			"data": [row[2] for row in rows],
+                        "borderColor": "#aaffaa",
+                        "backgroundColor": "#99ee99",
+                    },
+                    {
+                        "label": "More (overconfident)",
+			"data": [row[3] for row in rows],
+                        "borderColor": "#aaaaff",
+                        "backgroundColor": "#9999ee",
+                    },
+                ],
+	},
+        "options": {
+            "title": {
+                "display": True,
+                "text": title,
+            },
+            "tooltips": {
+                "mode": "index",
+            },
+            "scales": {
+                "yAxes": [
+                    {
+                        "stacked": True,
+                    },
+                ],
+            },
+        },
+    }
+
+def trend_chart_data(rows, title):
+    # rows are (date, answers, correct answers, confidence sum) in time order.
+    return {
+        "type": "line",
+        "data": {
+            "labels": [row[0].strftime("%Y-%m-%d") for row in rows],
+            "datasets": [
+                {
+                    "label": "Correct answers (percent)",
+                    "data": [100 * row[2] / row[1] for row in rows],
+                    "fill": False,
+                    "borderColor": "#aaaaff",
+                    "backgroundColor": "#9999ee",
+                },
+                {
+                    "label": "Mean confidence (percent)",
+                    "data": [float(row[3] / row[1]) for row in rows],
+                    "fill": False,
+                    "borderColor": "#aaffaa",
+                    "backgroundColor": "#99ee99",
+                },
+            ],
+        },
+        "options": {
+            "title": {
+                "display": True,
+                "text": title,
+            },
+            "tooltips": {
+                "mode": "index",
+            },
+        },
+    }
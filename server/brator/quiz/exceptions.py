@@ -15,3 +15,7 @@ class NoFactsAvailable(APIException):
 class PermissionDenied(APIException):
     status_code = 403
     default_detail = "Permission denied."
+
+class NotFound(APIException):
+    status_code = 404
+    default_detail = "Not found."
@@ -0,0 +1,107 @@
+import logging
+
+import beeline
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import jobs
+from . import logic
+from .exceptions import NotFound
+from .models import ImportChunk, ImportJob, ImportState
+
+logger = logging.getLogger(__name__)
+
+# Chunks written per run of an import job. Progress becomes visible as each
+# run commits, after which the job requeues itself for the rest.
+CHUNKS_PER_RUN = 10
+
+@beeline.traced(name="stage_fact_import")
+def stage_fact_import(user, chunks):
+    # chunks is an iterable of lists of fact records. They are saved one
+    # chunk at a time, so nothing needs to hold the whole upload; the job
+    # is queued once all of them are staged.
+    job = ImportJob.objects.create(
+        uid = logic.generate_uid(),
+        user = user,
+        state = ImportState.STAGING,
+    )
+    try:
+        for i, chunk in enumerate(chunks):
+            ImportChunk.objects.create(job = job, index = i, records = chunk)
+            job.total += len(chunk)
+    except Exception as e:
+        ImportJob.objects.filter(pk = job.pk).update(
+            state = ImportState.FAILED,
+            total = job.total,
+            last_error = str(e),
+        )
+        raise
+
+    job.state = ImportState.PENDING
+    job.save(update_fields = ["state", "total"])
+    logger.info("Staged import %s: %d facts", job.uid, job.total)
+
+    jobs.enqueue("import-facts", payload={"import_job_id": job.pk})
+    return job
+
+@jobs.job_handler("import-facts")
+@beeline.traced(name="run_fact_import")
+def run_fact_import(user, import_job_id):
+    job = ImportJob.objects.select_for_update().get(pk = import_job_id)
+    if job.state not in (ImportState.PENDING, ImportState.RUNNING):
+        return
+
+    job.state = ImportState.RUNNING
+    job.started_at = job.started_at or timezone.now()
+
+    chunks = list(job.chunks.filter(error = "").order_by("index")[:CHUNKS_PER_RUN + 1])
+    for chunk in chunks[:CHUNKS_PER_RUN]:
+        try:
+            with transaction.atomic():
+                counts = logic.post_facts(chunk.records)
+        except Exception as e:
+            logger.exception("Import %s: chunk %d failed", job.uid, chunk.index)
+            error = f"{type(e).__name__}: {e}"
+            ImportChunk.objects.filter(pk = chunk.pk).update(error = error)
+            job.failed += len(chunk.records)
+            job.last_error = f"Chunk {chunk.index}: {error}"
+        else:
+            chunk.delete()
+            job.unchanged += counts["unchanged"]
+            job.new += counts["new"]
+            job.updated += counts["updated"]
+        job.processed += len(chunk.records)
+
+    remaining = len(chunks) > CHUNKS_PER_RUN
+    if not remaining:
+        job.state = ImportState.DONE
+        job.finished_at = timezone.now()
+    job.save()
+
+    if remaining:
+        jobs.enqueue("import-facts", payload={"import_job_id": job.pk})
+
+def get_import_status(uid):
+    job = ImportJob.objects.filter(uid = uid).first()
+    if job is None:
+        raise NotFound(f"No import {uid}")
+
+    records_per_second = None
+    if job.started_at:
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            records_per_second = job.processed / elapsed
+
+    return {
+        "id": job.uid,
+        "state": job.state,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+        "unchanged": job.unchanged,
+        "new": job.new,
+        "updated": job.updated,
+        "records_per_second": records_per_second,
+        "last_error": job.last_error,
+    }
@@ -0,0 +1,117 @@
+import datetime
+import logging
+import traceback
+
+import beeline
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job, JobState
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = datetime.timedelta(seconds=30)
+CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+
+JOB_HANDLERS = {}
+
+def job_handler(kind):
+    def register(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return register
+
+def enqueue(kind, user=None, payload=None, dedupe=False):
+    payload = payload or {}
+
+    if settings.JOBS_RUN_INLINE:
+        # In a transaction of its own, as in run_job; the caller may not
+        # be in one.
+        with transaction.atomic():
+            JOB_HANDLERS[kind](user, **payload)
+        return
+
+    dedupe_key = None
+    if dedupe:
+        dedupe_key = f"{kind}:{user.pk if user else ''}"
+
+    Job.objects.bulk_create([
+        Job(
+            kind = kind,
+            user = user,
+            payload = payload,
+            dedupe_key = dedupe_key,
+            state = JobState.PENDING,
+        ),
+    ], ignore_conflicts=True)
+
+@beeline.traced(name="claim_jobs")
+def claim_jobs(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(
+            skip_locked = True,
+            of = ("self",),
+        ).select_related("user").filter(
+            Q(state = JobState.PENDING, run_after__lte = now)
+            | Q(state = JobState.RUNNING, claimed_at__lt = now - CLAIM_TIMEOUT)
+        ).order_by("run_after")[:limit])
+        Job.objects.filter(pk__in = [job.pk for job in jobs]).update(
+            state = JobState.RUNNING,
+            claimed_at = now,
+        )
+    return jobs
+
+def _retry_later(job, error):
+    attempts = job.attempts + 1
+    qs = Job.objects.filter(pk = job.pk)
+
+    if attempts >= MAX_ATTEMPTS:
+        logger.error("Giving up on %s after %d attempts", job, attempts)
+        qs.update(state = JobState.FAILED, attempts = attempts, last_error = error)
+        return
+
+    try:
+        with transaction.atomic():
+            qs.update(
+                state = JobState.PENDING,
+                attempts = attempts,
+                last_error = error,
+                claimed_at = None,
+                run_after = timezone.now() + RETRY_DELAY * 2 ** job.attempts,
+            )
+    except IntegrityError:
+        # A newer pending job with the same dedupe key will redo the work.
+        qs.delete()
+
+@beeline.traced(name="run_job")
+def run_job(job):
+    try:
+        with transaction.atomic():
+            JOB_HANDLERS[job.kind](job.user, **job.payload)
+    except Exception:
+        logger.exception("Job failed: %s", job)
+        _retry_later(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk = job.pk).delete()
+    return True
+
+@beeline.traced(name="run_pending_jobs")
+def run_pending_jobs(limit=100):
+    jobs = claim_jobs(limit)
+
+    # Jobs that were enqueued again while an earlier copy was running only
+    # need to be run once per batch.
+    done = set()
+    for job in jobs:
+        if job.dedupe_key and job.dedupe_key in done:
+            Job.objects.filter(pk = job.pk).delete()
+            continue
+        if run_job(job) and job.dedupe_key:
+            done.add(job.dedupe_key)
+
+    return len(jobs)
@@ -1,4 +1,5 @@
 import secrets
+import collections
 import canonicaljson
 import hashlib
 import decimal
@@ -6,12 +7,43 @@ import datetime
 import logging
 import random
 
+from typing import NamedTuple, Optional
+
 from . import apitype
+from . import caching
+from . import calibration
+from . import charts
+from . import jobs
+from . import rolling
+from . import rollups
+from . import sampling
+from . import seenset
+from . import validation
 
 import beeline
 
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, F, Max, Q
+
 STANDARD_SUMMARY_BATCHES = [20, 50]
 
+ROLLING_WINDOW_SIZES = [50]
+
+# Only this many of the most recent rolling scores are read for the chart,
+# which is then downsampled from those.
+ROLLING_CHART_ROWS = 2000
+
+# Windows, in days, whose stats are summed from the hourly rollups.
+ROLLUP_WINDOW_DAYS = [7, 30]
+TREND_DAYS = 90
+
+EXPORT_CHUNK_SIZE = 2000
+
+CHALLENGE_QUEUE_SIZE = 10
+CHALLENGE_QUEUE_LOW_WATER = 3
+
 def traced_function(f):
     name = f.__name__
     return beeline.traced(name=name)(f)
@@ -27,11 +59,17 @@ from .models import (
     NumericResponse,
     Response,
     SummaryScore,
+    SummaryProgress,
+    RollingScore,
     RESPONSE_MODELS,
+    CHALLENGE_MODELS,
     FACT_MODELS,
+    adjust_active_fact_counts,
 )
 
 from .stats import (
+    calculate_plausibilities_from_histograms,
+    calculate_plausibility_from_histogram,
     calculate_plausibility_of,
 )
 
@@ -48,28 +86,48 @@ logger = logging.getLogger(__name__)
 def generate_uid():
     return secrets.token_hex(16)
 
+def _sample_fact_ids(index, n, exclude):
+    sampler = index.sampler(random, exclude) if exclude is not None else None
+    rv = []
+    for _ in range(n):
+        fact_id = None
+        if sampler is not None:
+            fact_id = sampler.sample()
+            if fact_id is None:
+                logger.info("All facts have been excluded; allowing repeats.")
+                sampler = None
+        if fact_id is None:
+            fact_id = index.sample(random)
+        if fact_id is None:
+            break
+        rv.append(fact_id)
+    return rv
+
+@traced_function
+def select_random_facts(n, exclude=None):
+    facts = []
+    for attempt in range(2):
+        index = sampling.get_index(force_rebuild = attempt > 0)
+        fact_ids = _sample_fact_ids(index, n, exclude.copy() if exclude is not None else None)
+        if not fact_ids:
+            logger.info("Sampling index has no active facts.")
+            continue
+        found = Fact.objects.select_related(
+            "boolean_fact",
+            "numeric_fact",
+        ).filter(active = True).in_bulk(fact_ids)
+        facts = [found[fact_id] for fact_id in fact_ids if fact_id in found]
+        if len(facts) == len(fact_ids):
+            break
+        logger.info("Sampling index is stale (%d of %d sampled facts are no longer active).", len(fact_ids) - len(facts), len(fact_ids))
+    return facts
+
 @traced_function
 def select_random_fact():
-    cats = [cat for cat in FactCategory.objects.all() if cat.active]
-    logger.info(
-        "Selecting random facts: categories: %s",
-        [(cat.name, float(cat.weight)) for cat in cats],
-    )
-    cat_name = None
-    if not cats:
-        qs = Fact.objects.filter(active=True)
-        logger.info("No categories -- using legacy random selection.")
-    else:
-        total_weight = float(sum(cat.weight for cat in cats))
-        x = random.random() * total_weight
-        for cat in cats:
-            x -= float(cat.weight)
-            if x < 0:
-                break
-        cat_name = cat.name
-        qs = Fact.objects.filter(active=True, category=cat)
-    logger.info("Choosing randomly (from category %s) among %d options", cat_name, qs.count())
-    return qs.order_by("?").first()
+    facts = select_random_facts(1)
+    if not facts:
+        return None
+    return facts[0]
 
 @traced_function
 def _save_and_return(x):
@@ -77,62 +135,132 @@ def _save_and_return(x):
     return x
 
 @traced_function
-def create_boolean_challenge(fact):
-    return _save_and_return(BooleanChallenge(fact=fact))
+def create_challenge_from_fact(user, fact):
+    return create_challenges_from_facts(user, [fact])[0]
 
 @traced_function
-def create_numeric_challenge(fact):
-    return _save_and_return(NumericChallenge(fact=fact))
+@transaction.atomic
+def create_challenges_from_facts(user, facts, queued=False):
+    positions_by_type = collections.defaultdict(list)
+    for i, fact in enumerate(facts):
+        positions_by_type[fact.fact_type].append(i)
+
+    cores = [None] * len(facts)
+    for fact_type, positions in positions_by_type.items():
+        model = CHALLENGE_MODELS[fact_type]
+        fact_attname = fact_type + "_fact_id"
+        created = model.objects.bulk_create([
+            model(fact_id = getattr(facts[i], fact_attname))
+            for i in positions
+        ])
+        for i, core in zip(positions, created):
+            cores[i] = core
+
+    challenges = [
+        Challenge(
+            uid = generate_uid(),
+            user = user,
+            fact = fact,
+            challenge_type = fact.fact_type,
+            queued = queued,
+            **{fact.fact_type + "_challenge": core},
+        )
+        for fact, core in zip(facts, cores)
+    ]
+    validation.validate_all(challenges)
+    return Challenge.objects.bulk_create(challenges)
 
-@traced_function
-def create_challenge_from_fact(user, fact):
-    creators = {
-        "boolean_fact": create_boolean_challenge,
-        "numeric_fact": create_numeric_challenge,
-    }
-    kw = {
-        k.replace("_fact", "_challenge"): f(getattr(fact, k))
-        for k, f in creators.items()
-        if getattr(fact, k)
-    }
-    return _save_and_return(Challenge(
-        uid = generate_uid(),
+def _current_challenges_qs(user):
+    return Challenge.objects.filter(
         user = user,
-        fact = fact,
-        challenge_type = fact.fact_type,
-        **kw,
-    ))
+        active = True,
+        queued = False,
+        response__isnull = True,
+    )
+
+def _queued_challenges_qs(user):
+    return Challenge.objects.filter(
+        user = user,
+        active = True,
+        queued = True,
+        fact__active = True,
+    )
 
 @traced_function
-def get_or_create_current_challenge(user):
-    challenge = Challenge.objects.filter(
+@transaction.atomic
+def fill_challenge_queue(user, low_water=CHALLENGE_QUEUE_SIZE):
+    queued = _queued_challenges_qs(user).count()
+    if queued >= low_water:
+        return []
+
+    Challenge.objects.filter(
         user = user,
         active = True,
-        response__isnull = True,
-    ).order_by("-creation_time").first()
+        queued = True,
+        fact__active = False,
+    ).update(active = False)
+
+    exclude = None
+    if settings.NO_REPEAT_FACTS:
+        # Answered facts are in the seen set, so only the challenges that
+        # are still waiting for an answer need excluding.
+        exclude = seenset.load_seen_facts(user).copy()
+        for fact_id in _queued_challenges_qs(user).values_list("fact_id", flat=True):
+            exclude.add(fact_id)
+        current = _current_challenges_qs(user).order_by("-creation_time").values_list("fact_id", flat=True).first()
+        if current is not None:
+            exclude.add(current)
+
+    facts = select_random_facts(CHALLENGE_QUEUE_SIZE - queued, exclude=exclude)
+    logger.info("Topping up challenge queue (had %d, adding %d)", queued, len(facts))
+    return create_challenges_from_facts(user, facts, queued=True)
 
+@traced_function
+def pop_queued_challenge(user):
+    challenge = _queued_challenges_qs(user).select_for_update(
+        skip_locked = True,
+        of = ("self",),
+    ).order_by("pk").first()
+    if not challenge:
+        return None
+
+    challenge.queued = False
+    challenge.creation_time = timezone.now()
+    Challenge.objects.filter(pk = challenge.pk).update(
+        queued = challenge.queued,
+        creation_time = challenge.creation_time,
+    )
+    return challenge
+
+@traced_function
+@transaction.atomic
+def get_or_create_current_challenge(user):
+    challenge = _current_challenges_qs(user).order_by("-creation_time").first()
+    if challenge:
+        return challenge
+
+    challenge = pop_queued_challenge(user)
+    if not challenge:
+        fill_challenge_queue(user)
+        challenge = pop_queued_challenge(user)
     if not challenge:
-        fact = select_random_fact()
-        if not fact:
-            raise NoFactsAvailable()
-        challenge = create_challenge_from_fact(user, fact)
+        raise NoFactsAvailable()
+
+    fill_challenge_queue(user, low_water=CHALLENGE_QUEUE_LOW_WATER)
 
     return challenge
 
 @traced_function
 def discard_current_challenge(user, challenge_uid=None):
-    qs = Challenge.objects.filter(
-        user = user,
-        active = True,
-        response__isnull = True,
-    )
+    qs = _current_challenges_qs(user)
     if challenge_uid:
         qs = qs.filter(uid = challenge_uid)
     return qs.update(active = False)
 
 @traced_function
+@transaction.atomic
 def respond_to_challenge(user, challenge_uid, response):
-    challenge = Challenge.objects.get(user = user, uid = challenge_uid)
+    challenge = Challenge.objects.get(user = user, uid = challenge_uid, queued = False)
 
     try:
         challenge.response
@@ -165,8 +293,15 @@ def respond_to_challenge(user, challenge_uid, response):
         **{response_field: response_core},
     ))
 
-    for batch_size in STANDARD_SUMMARY_BATCHES:
-        maybe_summarize_responses(user, batch_size)
+    calibration.record_response(user, confidence, is_correct)
+    rollups.record_response(user, rv.creation_time, confidence, is_correct)
+
+    if settings.NO_REPEAT_FACTS:
+        seenset.mark_fact_seen(user, challenge.fact_id)
+
+    record_summarizable_response(user)
+
+    jobs.enqueue("summarize-responses", user=user, dedupe=True)
 
     return rv
 
@@ -188,7 +323,24 @@ def _maybe_pop(d, k):
     return None
 
 @traced_function
-def post_fact(fact_data):
+def deactivate_facts(qs):
+    qs = qs.filter(active = True)
+    deltas = collections.Counter()
+    for category_id, n in qs.order_by().values("category").annotate(n = Count("pk")).values_list("category", "n"):
+        deltas[category_id] -= n
+    rv = qs.update(active = False)
+    adjust_active_fact_counts(deltas)
+    return rv
+
+class _ParsedFact(NamedTuple):
+    key: str
+    category_name: Optional[str]
+    fact_type: str
+    payload: dict
+    kwargs: dict
+    version_hash: str
+
+def _parse_fact(fact_data):
     fact_data = dict(fact_data)
 
     key = fact_data.pop("key")
@@ -197,12 +349,6 @@ def post_fact(fact_data):
     if "category" in fact_data:
         category_name = fact_data.pop("category")
 
-    category = None
-    if category_name:
-        category, _ = FactCategory.objects.get_or_create(name = category_name)
-
-    logger.info("Attempting to post new fact (with key: %s)", key)
-
     kwargs = {
         "category": category_name,
         "source_link": _maybe_pop(fact_data, "source_link"),
@@ -223,6 +369,27 @@ def post_fact(fact_data):
 
     fact_hash = hashlib.sha256(fact_hashable).hexdigest()
 
+    del kwargs["category"]
+
+    return _ParsedFact(key, category_name, fact_type, fact_payload, kwargs, fact_hash)
+
+def fact_version_hash(fact_data):
+    return _parse_fact(fact_data).version_hash
+
+@traced_function
+@transaction.atomic
+def post_fact(fact_data):
+    fact = _parse_fact(fact_data)
+    key = fact.key
+
+    logger.info("Attempting to post new fact (with key: %s)", key)
+
+    category = None
+    if fact.category_name:
+        category, _ = FactCategory.objects.get_or_create(name = fact.category_name)
+
+    fact_hash = fact.version_hash
+
     logger.info("Attempting to post new fact (with key: %s, hash: %s)", key, fact_hash)
 
     old_fact = Fact.objects.filter(
@@ -234,77 +401,338 @@ def post_fact(fact_data):
             logger.info("Attempting to post new fact (with key: %s, hash: %s): rejected, same as active fact", key, fact_hash)
             return old_fact
 
-    field_name = fact_type + "_fact"
+    field_name = fact.fact_type + "_fact"
 
-    core = FACT_MODELS[fact_type].objects.create(**fact_payload)
+    core = FACT_MODELS[fact.fact_type].objects.create(**fact.payload)
 
-    kwargs["category"] = category
-    kwargs[field_name] = core
-
-    Fact.objects.filter(key = key).update(active = False)
+    deactivate_facts(Fact.objects.filter(key = key))
     return Fact.objects.create(
         key = key,
         active = True,
         version_hash = fact_hash,
-        fact_type = fact_type,
-        **kwargs,
+        fact_type = fact.fact_type,
+        category = category,
+        **{field_name: core},
+        **fact.kwargs,
     )
 
+def _get_or_create_categories(names):
+    categories = {
+        category.name: category
+        for category in FactCategory.objects.filter(name__in = names)
+    }
+    missing = [FactCategory(name = name) for name in names if name not in categories]
+    validation.validate_all(missing)
+    if missing:
+        FactCategory.objects.bulk_create(missing, ignore_conflicts=True)
+        categories.update(
+            (category.name, category)
+            for category in FactCategory.objects.filter(name__in = [c.name for c in missing])
+        )
+    return categories
+
+def _active_version_hashes(keys):
+    rv = collections.defaultdict(set)
+    for key, version_hash in Fact.objects.filter(
+        key__in = keys,
+        active = True,
+    ).values_list("key", "version_hash"):
+        rv[key].add(version_hash)
+    return rv
+
+@traced_function
+@transaction.atomic
+def post_facts(facts_data):
+    # Like calling post_fact for every fact, but with a fixed number of
+    # queries per fact type. If a key occurs more than once, the last
+    # occurrence wins. Returns how many keys were unchanged, new or updated.
+    facts = {}
+    for fact_data in facts_data:
+        fact = _parse_fact(fact_data)
+        # Fails like post_fact for an unknown fact type.
+        FACT_MODELS[fact.fact_type]
+        facts.pop(fact.key, None)
+        facts[fact.key] = fact
+
+    active = _active_version_hashes(list(facts))
+
+    rv = {"unchanged": 0, "new": 0, "updated": 0}
+    changed = []
+    for fact in facts.values():
+        if fact.version_hash in active.get(fact.key, ()):
+            rv["unchanged"] += 1
+            continue
+        rv["updated" if fact.key in active else "new"] += 1
+        changed.append(fact)
+
+    logger.info("Posting %d facts: %s", len(facts), rv)
+    if not changed:
+        return rv
+
+    categories = _get_or_create_categories({fact.category_name for fact in changed if fact.category_name})
+
+    cores = {}
+    by_type = collections.defaultdict(list)
+    for fact in changed:
+        by_type[fact.fact_type].append(fact)
+    for fact_type, group in by_type.items():
+        model = FACT_MODELS[fact_type]
+        objs = [model(**fact.payload) for fact in group]
+        validation.validate_all(objs)
+        for fact, obj in zip(group, model.objects.bulk_create(objs, batch_size=1000)):
+            cores[fact.key] = obj
+
+    deactivate_facts(Fact.objects.filter(key__in = [fact.key for fact in changed if fact.key in active]))
+
+    new_facts = [
+        Fact(
+            key = fact.key,
+            active = True,
+            version_hash = fact.version_hash,
+            fact_type = fact.fact_type,
+            category = categories.get(fact.category_name),
+            **{fact.fact_type + "_fact": cores[fact.key]},
+            **fact.kwargs,
+        )
+        for fact in changed
+    ]
+    validation.validate_all(new_facts)
+    Fact.objects.bulk_create(new_facts, batch_size=1000)
+
+    adjust_active_fact_counts(collections.Counter(obj.category_id for obj in new_facts))
+    sampling.invalidate_index()
+    return rv
+
 @traced_function
-def get_eval_stats_for_scope(user, limit=None, **kwargs):
-    qs = Response.objects.filter(user=user, **kwargs)
-    if limit is None:
-        objs = list(qs.all())
-    else:
-        objs = qs.order_by("-creation_time")[:limit]
-    correct = [o.correct for o in objs]
-    confidences = [o.confidence_percent/100 for o in objs]
-    assert len(correct) == len(confidences)
-    expected = sum(confidences)
-    confidence_correctness = list(zip(confidences, correct))
-    plausibility = calculate_plausibility_of(confidence_correctness)
+@transaction.atomic
+def sync_fact_manifest(user, manifest, deactivate_absent=False, categories=None):
+    # manifest maps fact keys to the version hashes post_fact would compute.
+    # Returns the keys whose facts need to be posted. With deactivate_absent,
+    # active facts in the given categories whose keys are not in the
+    # manifest are deactivated.
+    if not user.is_staff:
+        logger.info("User (%s) is not staff user: refusing manifest sync", repr(user))
+        raise PermissionDenied()
+
+    if not isinstance(manifest, dict) or not all(isinstance(v, str) for v in manifest.values()):
+        raise BadRequest("Manifest must map fact keys to version hashes")
+
+    # A manifest usually covers only some of the facts, so which ones it
+    # is authoritative for has to be stated.
+    if deactivate_absent and (not isinstance(categories, list) or not all(isinstance(x, str) for x in categories)):
+        raise BadRequest("deactivate_absent requires a list of categories")
+
+    active = _active_version_hashes(list(manifest))
+    needed = [
+        key
+        for key, version_hash in manifest.items()
+        if version_hash not in active.get(key, ())
+    ]
+
+    deactivated = 0
+    if deactivate_absent:
+        qs = Fact.objects.exclude(key__in = list(manifest)).filter(category__name__in = categories)
+        deactivated = deactivate_facts(qs)
+        sampling.invalidate_index()
+
+    logger.info(
+        "Fact manifest with %d keys: %d needed, %d deactivated",
+        len(manifest), len(needed), deactivated,
+    )
     return {
-        "number_of_answers": len(objs),
-        "number_of_correct_answers": sum(correct),
-        "expected_correct_answers": expected,
-        "plausibility": plausibility,
+        "needed": needed,
+        "unchanged": len(manifest) - len(needed),
+        "deactivated": deactivated,
     }
 
+def _latest_response_ids(user, limit):
+    return Response.objects.filter(user = user).order_by("-creation_time", "-pk").values("pk")[:limit]
+
+def _eval_stats_from_histogram(histogram, num_correct):
+    # histogram is a list of (confidence_percent, number of answers) pairs.
+    return {
+        "number_of_answers": sum(n for _, n in histogram),
+        "number_of_correct_answers": num_correct,
+        "expected_correct_answers": sum(conf * n for conf, n in histogram) / 100,
+        "plausibility": calculate_plausibility_from_histogram(
+            [(float(conf / 100), n) for conf, n in histogram],
+            num_correct,
+        ),
+    }
+
+@traced_function
+def get_calibration_metrics(user):
+    bands = calibration.get_calibration_bands(user)
+    if not bands:
+        return None
+    return [
+        {"label": label, **bands[name]}
+        for name, label in [
+            ("correct_percent", "Correct answers (percent)"),
+            ("mean_confidence_percent", "Mean confidence (percent)"),
+            ("overconfidence_percent", "Overconfidence (percentage points)"),
+            ("brier_score", "Brier score (lower is better)"),
+            ("log_score", "Log score (higher is better)"),
+        ]
+    ]
+
+@traced_function
+def get_category_eval_stats(user):
+    # Answers and correct answers per category and confidence level, in one
+    # query; facts without a category are grouped under None.
+    rows = Response.objects.filter(
+        user = user,
+    ).order_by().values(
+        "challenge__fact__category__name",
+        "confidence_percent",
+    ).annotate(
+        n = Count("pk"),
+        n_correct = Count("pk", filter = Q(correct = True)),
+    ).values_list("challenge__fact__category__name", "confidence_percent", "n", "n_correct")
+
+    cells = collections.defaultdict(list)
+    for name, conf, n, n_correct in rows:
+        cells[name].append((conf, n, n_correct))
+    names = sorted(cells, key=lambda name: (name is None, name))
+
+    plausibilities = calculate_plausibilities_from_histograms([
+        (
+            [(float(conf / 100), n) for conf, n, _ in cells[name]],
+            sum(n_correct for _, _, n_correct in cells[name]),
+        )
+        for name in names
+    ])
+
+    rv = []
+    for name, plausibility in zip(names, plausibilities):
+        answers = sum(n for _, n, _ in cells[name])
+        brier_sum = 0.0
+        for conf, n, n_correct in cells[name]:
+            p = float(conf / 100)
+            brier_sum += n_correct * (1 - p) ** 2 + (n - n_correct) * p ** 2
+        rv.append({
+            "category": name,
+            "number_of_answers": answers,
+            "number_of_correct_answers": sum(n_correct for _, _, n_correct in cells[name]),
+            "expected_correct_answers": sum(conf * n for conf, n, _ in cells[name]) / 100,
+            "brier_score": brier_sum / answers,
+            "plausibility": plausibility,
+        })
+    return rv
+
 @traced_function
 def get_eval_stats(user):
     now = datetime.datetime.now()
     cutoff_24h = now - datetime.timedelta(hours=24)
+    scopes = {
+        "24h": Q(creation_time__gte = cutoff_24h),
+        "last50": Q(pk__in = _latest_response_ids(user, 50)),
+        "last10": Q(pk__in = _latest_response_ids(user, 10)),
+    }
+
+    # Lifetime totals, and the PMF for them, are kept up to date by the
+    # calibration module. The other scopes only cover recent responses, and are counted per
+    # confidence level in a single pass.
+    annotations = {}
+    for i, q in enumerate(scopes.values()):
+        annotations[f"answers_{i}"] = Count("pk", filter = q)
+        annotations[f"correct_{i}"] = Count("pk", filter = q & Q(correct = True))
+    rows = list(
+        Response.objects.filter(user = user)
+        .filter(scopes["24h"] | scopes["last50"])
+        .order_by()
+        .values("confidence_percent")
+        .annotate(**annotations)
+    )
+
+    stats = {
+        "total": calibration.get_lifetime_stats(user),
+    }
+    for i, name in enumerate(scopes):
+        histogram = [
+            (row["confidence_percent"], row[f"answers_{i}"])
+            for row in rows
+            if row[f"answers_{i}"]
+        ]
+        num_correct = sum(row[f"correct_{i}"] for row in rows)
+        stats[name] = _eval_stats_from_histogram(histogram, num_correct)
+
+    # Longer windows only get totals, from the hourly rollups.
+    for days, window_stats in rollups.get_window_stats(user, ROLLUP_WINDOW_DAYS).items():
+        stats[f"{days}d"] = window_stats
+
     rv = {
-        "stats": {
-            "total": get_eval_stats_for_scope(user),
-            "24h": get_eval_stats_for_scope(user, creation_time__gte=cutoff_24h),
-            "last50": get_eval_stats_for_scope(user, limit=50),
-            "last10": get_eval_stats_for_scope(user, limit=10),
-        },
+        "stats": stats,
     }
     logger.info("Returning evaluation stats: %s", repr(rv))
     return rv
 
+@traced_function
+def get_summary_progress(user, batch_size, lock=False):
+    qs = SummaryProgress.objects.filter(user = user, batch_size = batch_size)
+    if lock:
+        qs = qs.select_for_update()
+    progress = qs.first()
+    if progress:
+        return progress
+
+    # First use for this user and batch size: pick up where the existing
+    # summaries left off.
+    last_response_id = Response.objects.filter(
+        user = user,
+        summary_scores__batch_size = batch_size,
+    ).aggregate(last = Max("pk"))["last"] or 0
+    pending = Response.objects.filter(
+        user = user,
+        resolved = True,
+        pk__gt = last_response_id,
+    ).count()
+    SummaryProgress.objects.bulk_create([
+        SummaryProgress(
+            user = user,
+            batch_size = batch_size,
+            last_response_id = last_response_id,
+            pending = pending,
+        ),
+    ], ignore_conflicts=True)
+    return qs.get()
+
+@traced_function
+def record_summarizable_response(user):
+    SummaryProgress.objects.filter(user = user).update(pending = F("pending") + 1)
+
 @traced_function
 def get_summarizable_responses_qs(user, batch_size):
+    progress = get_summary_progress(user, batch_size)
     return Response.objects.filter(
         user = user,
         resolved = True,
-    ).exclude(
-        summary_scores__batch_size = batch_size,
-    ).order_by("creation_time")
+        pk__gt = progress.last_response_id,
+    ).order_by("pk")
 
 @traced_function
 def get_summarizable_responses(user, batch_size):
     qs = get_summarizable_responses_qs(user, batch_size)
-    if qs.count() < batch_size:
+    batch = list(qs[:batch_size])
+    if len(batch) < batch_size:
         return None
-    return qs[:batch_size]
+    return batch
 
 @traced_function
+@transaction.atomic
 def maybe_summarize_responses(user, batch_size):
-    batch = get_summarizable_responses(user, batch_size)
-    if not batch:
+    progress = get_summary_progress(user, batch_size, lock=True)
+    if progress.pending < batch_size:
+        return None
+
+    batch = list(Response.objects.filter(
+        user = user,
+        resolved = True,
+        pk__gt = progress.last_response_id,
+    ).order_by("pk")[:batch_size])
+    if len(batch) < batch_size:
+        logger.warning("Summary progress for user %s (batch size %d) is off; recounting.", user.pk, batch_size)
+        SummaryProgress.objects.filter(pk = progress.pk).update(pending = len(batch))
         return None
 
     conf_corr = [
@@ -328,8 +756,22 @@ def maybe_summarize_responses(user, batch_size):
         probability_more_correct = resp["prob_more"],
     )
     rv.datapoints.set(batch)
+
+    SummaryProgress.objects.filter(pk = progress.pk).update(
+        last_response_id = batch[-1].pk,
+        pending = F("pending") - batch_size,
+    )
     return rv
 
+@jobs.job_handler("summarize-responses")
+@traced_function
+def summarize_responses(user):
+    for batch_size in STANDARD_SUMMARY_BATCHES:
+        while maybe_summarize_responses(user, batch_size):
+            pass
+    for window_size in ROLLING_WINDOW_SIZES:
+        rolling.update_rolling_window(user, window_size)
+
 @traced_function
 def get_last_summary(user, batch_size=None):
     batch_size = batch_size or STANDARD_SUMMARY_BATCHES[0]
@@ -341,8 +783,8 @@ def get_last_summary(user, batch_size=None):
 @traced_function
 def get_batch_progress(user, batch_size=None):
     batch_size = batch_size or STANDARD_SUMMARY_BATCHES[0]
-    qs = get_summarizable_responses_qs(user, batch_size)
-    achieved = min(batch_size, qs.count())
+    progress = get_summary_progress(user, batch_size)
+    achieved = min(batch_size, progress.pending)
     return achieved, batch_size
 
 @traced_function
@@ -362,7 +804,7 @@ def get_largest_standard_summarized_batch_size(user):
 
 @traced_function
 def get_challenge_by_uid(user, uid):
-    return Challenge.objects.get(user = user, uid = uid)
+    return Challenge.objects.get(user = user, uid = uid, queued = False)
 
 @traced_function
 def delete_user_account(user):
@@ -375,94 +817,174 @@ def get_summary_chart_data(user, batch_size = None):
     if not batch_size:
         return None
 
-    timestamps = []
-    lower = []
-    upper = []
-
-    scores = SummaryScore.objects.filter(
+    qs = SummaryScore.objects.filter(
         user = user,
         batch_size = batch_size,
-    ).all()
+    )
+
+    # A new score always gets a higher id, so the latest one versions the
+    # cached chart.
+    latest = qs.order_by("-pk").values_list("pk", flat=True).first()
+    if not latest:
+        return None
+
+    return caching.get_or_compute(
+        f"summary-chart-{batch_size}",
+        user,
+        latest,
+        lambda: charts.calibration_chart_data(
+            list(qs.order_by("pk").values_list(
+                "creation_time",
+                "probability_fewer_correct",
+                "probability_same_correct",
+                "probability_more_correct",
+            )),
+            f"Expected correct answers given calibration (batches of {batch_size})",
+        ),
+    )
+
+@traced_function
+def get_rolling_chart_data(user, window_size = None):
+    window_size = window_size or ROLLING_WINDOW_SIZES[0]
+
+    qs = RollingScore.objects.filter(
+        user = user,
+        window_size = window_size,
+    )
+
+    latest = qs.order_by("-pk").values_list("pk", flat=True).first()
+    if not latest:
+        return None
 
-    if not scores:
+    return caching.get_or_compute(
+        f"rolling-chart-{window_size}",
+        user,
+        latest,
+        lambda: charts.calibration_chart_data(
+            list(reversed(qs.order_by("-response").values_list(
+                "response__creation_time",
+                "probability_fewer_correct",
+                "probability_same_correct",
+                "probability_more_correct",
+            )[:ROLLING_CHART_ROWS])),
+            f"Expected correct answers given calibration (last {window_size} answers)",
+        ),
+    )
+
+@traced_function
+def get_trend_chart_data(user, days = TREND_DAYS):
+    rows = rollups.get_daily_trend(user, days)
+    if not rows:
         return None
+    return charts.trend_chart_data(rows, f"Correct answers and confidence per day (last {days} days)")
 
-    for score in scores:
-        timestamps.append(score.creation_time.strftime("%Y-%m-%d %H:%M"))
+@traced_function
+def get_calibration_curve_chart_data(user):
+    curve = calibration.get_calibration_curve(user)
+
+    if not curve:
+        return None
+
+    low = min(row["bin_low"] for row in curve)
+    bands = {
+        row["bin_low"]: row
+        for row in calibration.get_calibration_bands(user)["calibration_curve"]
+    }
 
     return {
-	"type": "line",
-	"data": {
-                "labels": [str(x) for x in timestamps],
-		"datasets": [
-                    {
-                        "label": "Fewer (underconfident)",
-			"data": [x.probability_fewer_correct for x in scores],
-                        "borderColor": "#ffaaaa",
-                        "backgroundColor": "#ee9999",
-                    },
-                    {
-                        "label": "Same (calibrated)",
-			"data": [x.probability_same_correct for x in scores],
-                        "borderColor": "#aaffaa",
-                        "backgroundColor": "#99ee99",
-                    },
-                    {
-                        "label": "More (overconfident)",
-			"data": [x.probability_more_correct for x in scores],
-                        "borderColor": "#aaaaff",
-                        "backgroundColor": "#9999ee",
-                    },
-                ],
-	},
+        "type": "scatter",
+        "data": {
+            "datasets": [
+                {
+                    "label": "Observed",
+                    "data": [{"x": row["mean_confidence_percent"], "y": row["correct_percent"]} for row in curve],
+                    "showLine": True,
+                    "fill": False,
+                    "borderColor": "#aaaaff",
+                    "backgroundColor": "#9999ee",
+                },
+                {
+                    "label": "95% interval (low)",
+                    "data": [
+                        {"x": row["mean_confidence_percent"], "y": bands[row["bin_low"]]["correct_percent_low"]}
+                        for row in curve
+                    ],
+                    "showLine": True,
+                    "fill": False,
+                    "pointRadius": 0,
+                    "borderColor": "#ddddff",
+                },
+                {
+                    "label": "95% interval (high)",
+                    "data": [
+                        {"x": row["mean_confidence_percent"], "y": bands[row["bin_low"]]["correct_percent_high"]}
+                        for row in curve
+                    ],
+                    "showLine": True,
+                    "fill": "-1",
+                    "pointRadius": 0,
+                    "borderColor": "#ddddff",
+                    "backgroundColor": "rgba(153, 153, 238, 0.2)",
+                },
+                {
+                    "label": "Calibrated",
+                    "data": [{"x": low, "y": low}, {"x": 100, "y": 100}],
+                    "showLine": True,
+                    "fill": False,
+                    "pointRadius": 0,
+                    "borderColor": "#aaffaa",
+                    "backgroundColor": "#99ee99",
+                },
+            ],
+        },
         "options": {
             "title": {
                 "display": True,
-                "text": f"Expected correct answers given calibration (batches of {batch_size})",
-            },
-            "tooltips": {
-                "mode": "index",
-            },
-            "scales": {
-                "yAxes": [
-                    {
-                        "stacked": True,
-                    },
-                ],
+                "text": "Correct answers by stated confidence (percent)",
             },
         },
     }
 
-@traced_function
-def export_facts(user):
-    if not user.is_staff:
-        logger.info("User (%s) is not staff user: refusing export", repr(user))
-        raise PermissionDenied()
-
+def _export_fact(obj):
+    # The same dict as building an apitype.Fact and dropping empty fields,
+    # without the per-row pydantic validation.
+    rv = {
+        "key": obj.key,
+        "category": obj.category.name if obj.category else None,
+    }
+    core = getattr(obj, obj.fact_type + "_fact").export()
+    if obj.fact_type == FactType.NUMERIC:
+        core["numeric"]["correct_answer"] = str(core["numeric"]["correct_answer"])
+    rv.update(core)
+    rv["source"] = obj.source
+    rv["source_link"] = obj.source_link
+    rv["fine_print"] = obj.fine_print
+    return {k: v for k, v in rv.items() if v}
+
+def _iter_export_facts(chunk_size):
     qs = Fact.objects.filter(
         active = True,
-    ).select_related("category")
+    ).select_related("category", "boolean_fact", "numeric_fact").order_by("pk")
 
-    logger.info("Exporting %d facts.", qs.count())
+    n = 0
+    for obj in qs.iterator(chunk_size=chunk_size):
+        yield _export_fact(obj)
+        n += 1
+    logger.info("Exported %d facts.", n)
 
-    rv = []
+@traced_function
+def iter_export_facts(user, chunk_size=EXPORT_CHUNK_SIZE):
+    # Checks permissions right away; the facts are then read lazily through
+    # a server-side cursor, chunk_size rows at a time.
+    if not user.is_staff:
+        logger.info("User (%s) is not staff user: refusing export", repr(user))
+        raise PermissionDenied()
 
-    for obj in qs.order_by("pk"):
-        attrname = obj.fact_type + "_fact"
-        kwargs = getattr(obj, attrname).export()
-
-        logger.info("Exporting fact: %s (cat: %s)", repr(obj), repr(obj.category))
-
-        rv.append(apitype.Fact(
-            key = obj.key,
-            category = obj.category.name if obj.category else None,
-            fine_print = obj.fine_print,
-            source = obj.source,
-            source_link = obj.source_link,
-            **kwargs,
-        ))
+    return _iter_export_facts(chunk_size)
 
-    return [{k: v for k, v in x.dict().items() if v} for x in rv]
+@traced_function
+def export_facts(user):
+    return list(iter_export_facts(user))
 
 @traced_function
 def export_fact_categories(user):
@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...stats import (
+    poisson_binomial_dft_pmf,
+    poisson_binomial_pmf,
+    poisson_binomial_pmf_product_tree,
+)
+
+# Above this size the reference implementation is only timed for k = 0 and
+# extrapolated to the full PMF.
+MAX_FULL_REFERENCE = 50
+
+def _best_of(f, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+class Command(BaseCommand):
+    help = "Compare the reference, FFT and product tree Poisson-binomial PMF implementations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("sizes", nargs="*", type=int, default=[20, 50, 500])
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=1234)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        repeat = options["repeat"]
+
+        for n in options["sizes"]:
+            ps = [rng.uniform(0.5, 0.99) for _ in range(n)]
+
+            fft = _best_of(lambda: poisson_binomial_pmf(ps), repeat)
+            tree = _best_of(lambda: poisson_binomial_pmf_product_tree(ps), repeat)
+
+            if n <= MAX_FULL_REFERENCE:
+                reference = _best_of(lambda: [poisson_binomial_dft_pmf(ps, k) for k in range(n + 1)], repeat)
+                note = ""
+            else:
+                reference = _best_of(lambda: poisson_binomial_dft_pmf(ps, 0), 1) * (n + 1)
+                note = " (extrapolated)"
+
+            error = max(
+                abs(pmf[k] - poisson_binomial_dft_pmf(ps, k))
+                for pmf in (poisson_binomial_pmf(ps), poisson_binomial_pmf_product_tree(ps))
+                for k in (0, n // 2, n)
+            )
+
+            self.stdout.write(
+                f"n={n:>5}: reference {reference * 1e3:10.2f} ms{note}, "
+                f"fft {fft * 1e3:8.3f} ms, product tree {tree * 1e3:8.3f} ms, speedup {reference / min(fft, tree):8.0f}x, max error {error:.1e}"
+            )
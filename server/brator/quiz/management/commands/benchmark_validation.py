@@ -0,0 +1,70 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.signals import pre_save
+
+from ... import validation
+from ...logic import create_challenges_from_facts
+from ...models import Challenge, Fact, FactType, BooleanFact
+from ...signals import validate_model
+
+def _legacy_validate_model(instance, **kwargs):
+    # What the pre_save hook used to do: call clean() on every model and
+    # find tagged union fields by reflection.
+    spec = getattr(instance, "tagged_union", None)
+    if spec:
+        validation.validate_tagged_union_by_reflection(instance, *spec)
+    instance.clean()
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = "Measure the cost of saving models with the legacy and the current pre_save validation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--saves", type=int, default=500)
+
+    def _time_saves(self, challenge_ids):
+        start = time.perf_counter()
+        for pk in challenge_ids:
+            challenge = Challenge.objects.get(pk = pk)
+            challenge.active = not challenge.active
+            challenge.save()
+        return (time.perf_counter() - start) / len(challenge_ids)
+
+    def handle(self, *args, **options):
+        n = options["saves"]
+        results = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username="benchmark-validation-user")
+                fact = Fact.objects.create(
+                    key = "benchmark-validation-fact",
+                    fact_type = FactType.BOOLEAN,
+                    boolean_fact = BooleanFact.objects.create(
+                        question_text = "Is this a benchmark?",
+                        correct_answer = True,
+                    ),
+                )
+                challenge_ids = [c.pk for c in create_challenges_from_facts(user, [fact] * n)]
+
+                pre_save.disconnect(validate_model)
+                try:
+                    results["none"] = self._time_saves(challenge_ids)
+                    pre_save.connect(_legacy_validate_model)
+                    try:
+                        results["legacy"] = self._time_saves(challenge_ids)
+                    finally:
+                        pre_save.disconnect(_legacy_validate_model)
+                finally:
+                    pre_save.connect(validate_model)
+                results["registry"] = self._time_saves(challenge_ids)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        for name in ("none", "legacy", "registry"):
+            self.stdout.write(f"{name:>10}: {results[name] * 1e3:.3f} ms per load+save ({n} saves)")
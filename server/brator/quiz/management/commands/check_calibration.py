@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import calibration
+
+class Command(BaseCommand):
+    help = "Compare the per-user calibration aggregates against the responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Only check this user id.")
+
+    def handle(self, *args, **options):
+        problems = calibration.check(options["user_ids"])
+        for user_id, problem in problems:
+            self.stdout.write(f"User {user_id}: {problem}")
+        if problems:
+            raise CommandError(f"Calibration aggregates are inconsistent for {len({u for u, _ in problems})} users; run rebuild_calibration.")
+        self.stdout.write("Calibration aggregates are consistent.")
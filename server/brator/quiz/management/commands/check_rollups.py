@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import rollups
+
+class Command(BaseCommand):
+    help = "Compare the hourly per-user response rollups against the responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Only check this user id.")
+
+    def handle(self, *args, **options):
+        problems = rollups.check(options["user_ids"])
+        for user_id, problem in problems:
+            self.stdout.write(f"User {user_id}: {problem}")
+        if problems:
+            raise CommandError(f"Response rollups are inconsistent for {len({u for u, _ in problems})} users; run rebuild_rollups.")
+        self.stdout.write("Response rollups are consistent.")
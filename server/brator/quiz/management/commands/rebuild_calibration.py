@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ... import calibration
+
+class Command(BaseCommand):
+    help = "Recompute the per-user calibration aggregates from the responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Only rebuild for this user id.")
+
+    def handle(self, *args, **options):
+        n = calibration.rebuild(options["user_ids"])
+        self.stdout.write(f"Rebuilt calibration aggregates for {n} users.")
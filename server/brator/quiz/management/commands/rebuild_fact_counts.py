@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...models import FactCategory, recount_active_facts
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized active fact counts of all fact categories."
+
+    def handle(self, *args, **options):
+        recount_active_facts()
+        for name, count in FactCategory.objects.order_by("name").values_list("name", "active_fact_count"):
+            self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import jobs
+from ... import imports  # Imported for its job handlers
+from ... import logic  # Imported for its job handlers
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (summaries, imports, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        while True:
+            n = jobs.run_pending_jobs(limit=options["batch_size"])
+            if n:
+                self.stdout.write(f"Ran {n} jobs.")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:38
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_active_facts(apps, schema_editor):
+    Fact = apps.get_model('quiz', 'Fact')
+    FactCategory = apps.get_model('quiz', 'FactCategory')
+    counts = Fact.objects.filter(
+        category=models.OuterRef('pk'),
+        active=True,
+    ).order_by().values('category').annotate(n=models.Count('pk')).values('n')
+    FactCategory.objects.update(
+        active_fact_count=Coalesce(models.Subquery(counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0016_auto_20210324_2258'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factcategory',
+            name='active_fact_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_active_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0017_factcategory_active_fact_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='queued',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['user', 'queued', 'active'], name='quiz_challe_user_id_8db99b_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0018_challenge_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenFactSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bitmap', models.BinaryField(default=b'')),
+                ('version', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0019_seenfactset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_size', models.IntegerField()),
+                ('last_response_id', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='summaryprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'batch_size'), name='unique_summary_progress'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0020_summaryprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(max_length=64)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('dedupe_key', models.CharField(blank=True, max_length=200, null=True)),
+                ('state', models.TextField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], max_length=32)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['state', 'run_after'], name='quiz_job_state_959bc7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'pending')), fields=('dedupe_key',), name='unique_pending_job'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_calibration(apps, schema_editor):
+    Response = apps.get_model('quiz', 'Response')
+    UserCalibration = apps.get_model('quiz', 'UserCalibration')
+    CalibrationBucket = apps.get_model('quiz', 'CalibrationBucket')
+    rows = Response.objects.order_by().values('user', 'confidence_percent').annotate(
+        n=models.Count('pk'),
+        n_correct=models.Count('pk', filter=models.Q(correct=True)),
+    ).values_list('user', 'confidence_percent', 'n', 'n_correct')
+    calibrations = {}
+    buckets = []
+    for user_id, conf, n, n_correct in rows:
+        calibration = calibrations.setdefault(user_id, UserCalibration(user_id=user_id))
+        calibration.answers += n
+        calibration.correct_answers += n_correct
+        calibration.confidence_percent_sum += conf * n
+        buckets.append(CalibrationBucket(
+            user_id=user_id,
+            confidence_percent=conf,
+            answers=n,
+            correct_answers=n_correct,
+        ))
+    UserCalibration.objects.bulk_create(calibrations.values(), batch_size=1000)
+    CalibrationBucket.objects.bulk_create(buckets, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0021_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCalibration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.IntegerField(default=0)),
+                ('correct_answers', models.IntegerField(default=0)),
+                ('confidence_percent_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalibrationBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confidence_percent', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('answers', models.IntegerField(default=0)),
+                ('correct_answers', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='calibrationbucket',
+            constraint=models.UniqueConstraint(fields=('user', 'confidence_percent'), name='unique_calibration_bucket'),
+        ),
+        migrations.RunPython(build_calibration, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0022_calibration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercalibration',
+            name='pmf',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='usercalibration',
+            name='pmf_offset',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0023_usercalibration_pmf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollingWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_size', models.IntegerField()),
+                ('first_response_id', models.IntegerField(default=0)),
+                ('last_response_id', models.IntegerField(default=0)),
+                ('answers', models.IntegerField(default=0)),
+                ('correct_answers', models.IntegerField(default=0)),
+                ('confidence_percent_sum', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('pmf', models.BinaryField(default=b'')),
+                ('updates_since_recompute', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollingScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_size', models.IntegerField()),
+                ('actual_correct', models.IntegerField()),
+                ('expected_correct', models.DecimalField(decimal_places=4, max_digits=8)),
+                ('probability_fewer_correct', models.DecimalField(decimal_places=8, max_digits=9)),
+                ('probability_same_correct', models.DecimalField(decimal_places=8, max_digits=9)),
+                ('probability_more_correct', models.DecimalField(decimal_places=8, max_digits=9)),
+                ('response', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rolling_scores', to='quiz.response')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rollingwindow',
+            constraint=models.UniqueConstraint(fields=('user', 'window_size'), name='unique_rolling_window'),
+        ),
+        migrations.AddIndex(
+            model_name='rollingscore',
+            index=models.Index(fields=['user', 'window_size', 'response'], name='quiz_rollin_user_id_cbd1df_idx'),
+        ),
+    ]
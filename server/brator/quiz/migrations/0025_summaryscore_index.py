@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0024_rolling'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='summaryscore',
+            index=models.Index(fields=['user', 'batch_size'], name='quiz_summar_user_id_ef6cbb_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions
+
+
+def build_rollups(apps, schema_editor):
+    Response = apps.get_model('quiz', 'Response')
+    ResponseRollup = apps.get_model('quiz', 'ResponseRollup')
+    rows = Response.objects.annotate(
+        period_start=django.db.models.functions.TruncHour('creation_time'),
+    ).order_by().values('user', 'period_start').annotate(
+        n=models.Count('pk'),
+        n_correct=models.Count('pk', filter=models.Q(correct=True)),
+        confidence_sum=models.Sum('confidence_percent'),
+    ).values_list('user', 'period_start', 'n', 'n_correct', 'confidence_sum')
+    ResponseRollup.objects.bulk_create((
+        ResponseRollup(
+            user_id=user_id,
+            period_start=period_start,
+            answers=n,
+            correct_answers=n_correct,
+            confidence_percent_sum=confidence_sum,
+        )
+        for user_id, period_start, n, n_correct, confidence_sum in rows.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0025_summaryscore_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('answers', models.IntegerField(default=0)),
+                ('correct_answers', models.IntegerField(default=0)),
+                ('confidence_percent_sum', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='responserollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period_start'), name='unique_response_rollup'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0026_response_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(max_length=32, unique=True)),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('state', models.TextField(choices=[('staging', 'Staging'), ('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], max_length=32)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('total', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('unchanged', models.IntegerField(default=0)),
+                ('new', models.IntegerField(default=0)),
+                ('updated', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('records', models.JSONField()),
+                ('error', models.TextField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='quiz.importjob')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importchunk',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_import_chunk'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from django.utils import timezone
 
 from . import apitype
+from .validation import TaggedUnion, validate_tagged_union
 
 import re
 import inspect
@@ -24,26 +27,6 @@ def ConfidenceField():
 def NumericField():
     return models.DecimalField(max_digits=32, decimal_places=2)
 
-def _validate_tagged_union(obj, choiceclass, tag_field, suffix):
-    class_name = obj.__class__.__name__
-
-    tag = getattr(obj, tag_field)
-
-    valid = [x[0] for x in choiceclass.choices]
-    if tag not in valid:
-        raise ValidationError(f"{class_name}: {tag_field} has illegal value {tag}; legal values: {' '.join(valid)}")
-
-    expected_field = tag + suffix
-
-    if not getattr(obj, expected_field, None):
-        raise ValidationError(f"{class_name}: {tag_field} is {tag}; {expected_field} must be set")
-
-    field_names = [name for name in dir(obj) if name.endswith(suffix)]
-    set_field_names = [name for name in field_names if getattr(obj, name, None)]
-
-    if len(set_field_names) > 1:
-        raise ValidationError(f"{class_name}: multiple tagged union fields set: {' '.join(set_field_names)}")
-
 class FactType(models.TextChoices):
     BOOLEAN = "boolean"
     NUMERIC = "numeric"
@@ -146,9 +129,11 @@ class FactCategory(models.Model):
 
     weight = models.DecimalField(max_digits=8, decimal_places=2, default=1)
 
+    active_fact_count = models.IntegerField(default=0, editable=False)
+
     @property
     def number_of_active_facts(self):
-        return self.fact_set.filter(active=True).count()
+        return self.active_fact_count
 
     @property
     def active(self):
@@ -181,8 +166,27 @@ class Fact(models.Model):
     boolean_fact = models.ForeignKey(BooleanFact, on_delete=models.CASCADE, null=True, blank=True)
     numeric_fact = models.ForeignKey(NumericFact, on_delete=models.CASCADE, null=True, blank=True)
 
+    tagged_union = TaggedUnion(FactType, "fact_type", "_fact")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "active" in field_names and "category_id" in field_names:
+            instance.remember_counted_category()
+        return instance
+
+    @property
+    def counted_category_id(self):
+        if self.active:
+            return self.category_id
+        return None
+
+    def remember_counted_category(self):
+        # The category whose active_fact_count currently includes this fact.
+        self._counted_category_id = self.counted_category_id
+
     def clean(self):
-        _validate_tagged_union(self, FactType, "fact_type", "_fact")
+        validate_tagged_union(self)
 
         if not self.key:
             raise ValidationError("No key supplied.")
@@ -196,13 +200,21 @@ class Challenge(models.Model):
     fact = models.ForeignKey(Fact, on_delete=models.CASCADE)
 
     active = models.BooleanField(default=True)
+    queued = models.BooleanField(default=False)
     challenge_type = TagField(FactType)
     
     boolean_challenge = models.ForeignKey(BooleanChallenge, on_delete=models.CASCADE, null=True, blank=True)
     numeric_challenge = models.ForeignKey(NumericChallenge, on_delete=models.CASCADE, null=True, blank=True)
 
+    tagged_union = TaggedUnion(FactType, "challenge_type", "_challenge")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "queued", "active"]),
+        ]
+
     def clean(self):
-        _validate_tagged_union(self, FactType, "challenge_type", "_challenge")
+        validate_tagged_union(self)
 
     @property
     def challenge(self):
@@ -227,8 +239,60 @@ class Response(models.Model):
     boolean_response = models.ForeignKey(BooleanResponse, on_delete=models.CASCADE, null=True, blank=True)
     numeric_response = models.ForeignKey(NumericResponse, on_delete=models.CASCADE, null=True, blank=True)
 
+    tagged_union = TaggedUnion(FactType, "response_type", "_response")
+
     def clean(self):
-        _validate_tagged_union(self, FactType, "response_type", "_response")
+        validate_tagged_union(self)
+
+class SeenFactSet(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    # Bit i is set if the user has answered a challenge for the fact with id i.
+    bitmap = models.BinaryField(default=b"")
+    version = models.IntegerField(default=0)
+
+class UserCalibration(models.Model):
+    # Running totals over all of the user's responses, updated as they come
+    # in; see calibration.py.
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    answers = models.IntegerField(default=0)
+    correct_answers = models.IntegerField(default=0)
+    confidence_percent_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # PMF of the number of correct answers for a calibrated user, as
+    # little-endian float64s; element i is for pmf_offset + i correct
+    # answers. Empty if it has not been computed yet.
+    pmf = models.BinaryField(default=b"")
+    pmf_offset = models.IntegerField(default=0)
+
+class CalibrationBucket(models.Model):
+    # The user's responses at one confidence level.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    confidence_percent = ConfidenceField()
+
+    answers = models.IntegerField(default=0)
+    correct_answers = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "confidence_percent"], name="unique_calibration_bucket"),
+        ]
+
+class ResponseRollup(models.Model):
+    # The user's responses created during the hour starting at period_start;
+    # see rollups.py.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    period_start = models.DateTimeField()
+
+    answers = models.IntegerField(default=0)
+    correct_answers = models.IntegerField(default=0)
+    confidence_percent_sum = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period_start"], name="unique_response_rollup"),
+        ]
 
 class SummaryScore(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
@@ -244,6 +308,102 @@ class SummaryScore(models.Model):
     probability_same_correct = models.DecimalField(max_digits=9, decimal_places=8)
     probability_more_correct = models.DecimalField(max_digits=9, decimal_places=8)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "batch_size"]),
+        ]
+
+class RollingWindow(models.Model):
+    # The user's last window_size resolved responses, from first_response_id
+    # to last_response_id; see rolling.py.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    window_size = models.IntegerField()
+
+    first_response_id = models.IntegerField(default=0)
+    last_response_id = models.IntegerField(default=0)
+    answers = models.IntegerField(default=0)
+    correct_answers = models.IntegerField(default=0)
+    confidence_percent_sum = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+
+    # PMF of the number of correct answers in the window, as little-endian
+    # float64s, and how many responses have been added and removed since it
+    # was last computed from scratch.
+    pmf = models.BinaryField(default=b"")
+    updates_since_recompute = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "window_size"], name="unique_rolling_window"),
+        ]
+
+class RollingScore(models.Model):
+    # The plausibility of the window ending with response.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    window_size = models.IntegerField()
+    response = models.ForeignKey(Response, on_delete=models.CASCADE, related_name="rolling_scores")
+
+    actual_correct = models.IntegerField()
+    expected_correct = models.DecimalField(max_digits=8, decimal_places=4)
+
+    probability_fewer_correct = models.DecimalField(max_digits=9, decimal_places=8)
+    probability_same_correct = models.DecimalField(max_digits=9, decimal_places=8)
+    probability_more_correct = models.DecimalField(max_digits=9, decimal_places=8)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "window_size", "response"]),
+        ]
+
+class SummaryProgress(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    batch_size = models.IntegerField()
+
+    # Responses up to and including this one have been summarized; pending
+    # counts the resolved responses after it.
+    last_response_id = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "batch_size"], name="unique_summary_progress"),
+        ]
+
+class JobState(models.TextChoices):
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+
+class Job(models.Model):
+    creation_time = models.DateTimeField(auto_now_add=True)
+
+    kind = models.CharField(max_length=64)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+
+    # At most one pending job may exist per dedupe key.
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+
+    state = TagField(JobState)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=models.Q(state="pending"),
+                name="unique_pending_job",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["state", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"Job(kind={repr(self.kind)}, state={repr(self.state)}, attempts={self.attempts})"
+
 class FeedbackType(models.TextChoices):
     WRONG = "wrong", "Provided answer is wrong"
     NONSENSE = "nonsense", "Question is incomprehensible"
@@ -265,6 +425,66 @@ class ChallengeFeedback(models.Model):
         if self.user != self.challenge.user:
             raise ValidationError(f"Feedback for a different user's challenge")
 
+class ImportState(models.TextChoices):
+    STAGING = "staging"
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class ImportJob(models.Model):
+    # An upload of facts, staged as ImportChunks and written by the job
+    # queue; see imports.py.
+    uid = UidField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+
+    creation_time = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    state = TagField(ImportState)
+    last_error = models.TextField(blank=True, default="")
+
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    unchanged = models.IntegerField(default=0)
+    new = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+
+class ImportChunk(models.Model):
+    # Records of an import not written yet. Chunks are deleted once
+    # written; a chunk that could not be written keeps its error.
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="chunks")
+    index = models.IntegerField()
+    records = models.JSONField()
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "index"], name="unique_import_chunk"),
+        ]
+
+def adjust_active_fact_counts(deltas):
+    for category_id, delta in deltas.items():
+        if category_id is None or not delta:
+            continue
+        FactCategory.objects.filter(pk = category_id).update(
+            active_fact_count = models.F("active_fact_count") + delta,
+        )
+
+def recount_active_facts(category_ids=None):
+    qs = FactCategory.objects.all()
+    if category_ids is not None:
+        qs = qs.filter(pk__in = category_ids)
+    counts = Fact.objects.filter(
+        category = models.OuterRef("pk"),
+        active = True,
+    ).order_by().values("category").annotate(n = models.Count("pk")).values("n")
+    return qs.update(
+        active_fact_count = Coalesce(models.Subquery(counts), 0),
+    )
+
 def _register_models(maybe_models: List[Any]):
     for model in maybe_models:
         if not inspect.isclass(model):
@@ -278,6 +498,11 @@ RESPONSE_MODELS = {
     FactType.NUMERIC: NumericResponse,
 }
 
+CHALLENGE_MODELS = {
+    FactType.BOOLEAN: BooleanChallenge,
+    FactType.NUMERIC: NumericChallenge,
+}
+
 FACT_MODELS = {
     FactType.BOOLEAN: BooleanFact,
     FactType.NUMERIC: NumericFact,
@@ -1,7 +1,11 @@
+import io
 import pytest
 
 from .models import Fact, BooleanFact, NumericFact
+from . import validation
 
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
 from django.test import TestCase
 
 
@@ -88,3 +92,35 @@ class ModelTest(TestCase):
                     correct_answer = 42,
                 ),
             )
+
+
+class ValidationRegistryTest(TestCase):
+
+    def test_models_without_clean_are_skipped(self):
+        assert not validation.get_validator(BooleanFact).needs_clean
+        assert validation.get_validator(NumericFact).needs_clean
+        assert not validation.get_validator(Session).needs_clean
+
+    def test_tagged_union_columns(self):
+        validator = validation.get_validator(Fact)
+        assert validator.tagged_union.tag_field == "fact_type"
+        assert validator.attnames == ("boolean_fact_id", "numeric_fact_id")
+
+    def test_validation_does_not_query(self):
+        Fact.objects.create(
+            key = "foo",
+            fact_type = "boolean",
+            boolean_fact = BooleanFact.objects.create(
+                question_text = "Yes?",
+                correct_answer = True,
+            ),
+        )
+        fact = Fact.objects.get()
+        with self.assertNumQueries(0):
+            validation.validate(fact)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("benchmark_validation", saves=3, stdout=out)
+        assert "registry" in out.getvalue()
+        assert not Fact.objects.exists()
@@ -0,0 +1,99 @@
+import collections
+
+import beeline
+import numpy as np
+
+from django.db import transaction
+
+from . import stats
+from .models import Response, RollingScore, RollingWindow
+
+# The window PMF is updated by multiplying in each new response and
+# dividing out the oldest one. Division amplifies rounding errors, so the
+# PMF is recomputed from scratch once per window's worth of updates, or as
+# soon as it strays this far from being a probability distribution.
+MAX_PMF_DRIFT = 1e-9
+
+def _probability(confidence_percent):
+    return confidence_percent / 100
+
+def _compute_pmf(entries):
+    return stats.pmf_from_histogram(
+        collections.Counter(_probability(conf) for _, conf, _ in entries).items()
+    )
+
+def _drifted(pmf):
+    return abs(pmf.sum() - 1) > MAX_PMF_DRIFT or pmf.min() < -MAX_PMF_DRIFT
+
+@beeline.traced(name="update_rolling_window")
+@transaction.atomic
+def update_rolling_window(user, window_size):
+    window, _ = RollingWindow.objects.select_for_update().get_or_create(
+        user = user,
+        window_size = window_size,
+    )
+
+    # (pk, confidence_percent, correct) for the current window and every
+    # response after it.
+    rows = list(Response.objects.filter(
+        user = user,
+        resolved = True,
+        pk__gte = window.first_response_id,
+    ).order_by("pk").values_list("pk", "confidence_percent", "correct"))
+    entries = collections.deque(row for row in rows if row[0] <= window.last_response_id)
+    new_rows = [row for row in rows if row[0] > window.last_response_id]
+    if not new_rows:
+        return 0
+
+    if len(window.pmf) and len(entries) == window.answers:
+        pmf = np.frombuffer(window.pmf, dtype="<f8")
+        updates = window.updates_since_recompute
+    else:
+        pmf = _compute_pmf(entries)
+        updates = 0
+    correct_answers = sum(correct for _, _, correct in entries)
+    confidence_percent_sum = sum(conf for _, conf, _ in entries)
+
+    scores = []
+    for row in new_rows:
+        pk, conf, correct = row
+        entries.append(row)
+        pmf = stats.multiply_pmf(pmf, _probability(conf))
+        correct_answers += correct
+        confidence_percent_sum += conf
+
+        if len(entries) > window_size:
+            _, old_conf, old_correct = entries.popleft()
+            pmf = stats.divide_pmf(pmf, _probability(old_conf))
+            correct_answers -= old_correct
+            confidence_percent_sum -= old_conf
+
+        updates += 1
+        if updates >= window_size or _drifted(pmf):
+            pmf = _compute_pmf(entries)
+            updates = 0
+
+        if len(entries) == window_size:
+            plausibility = stats.plausibility_from_pmf(np.clip(pmf, 0, None), 0, correct_answers)
+            scores.append(RollingScore(
+                user = user,
+                window_size = window_size,
+                response_id = pk,
+                actual_correct = correct_answers,
+                expected_correct = confidence_percent_sum / 100,
+                probability_fewer_correct = plausibility["prob_fewer"],
+                probability_same_correct = plausibility["prob_same"],
+                probability_more_correct = plausibility["prob_more"],
+            ))
+
+    RollingScore.objects.bulk_create(scores, batch_size=1000)
+    RollingWindow.objects.filter(pk = window.pk).update(
+        first_response_id = entries[0][0],
+        last_response_id = entries[-1][0],
+        answers = len(entries),
+        correct_answers = correct_answers,
+        confidence_percent_sum = confidence_percent_sum,
+        pmf = pmf.astype("<f8").tobytes(),
+        updates_since_recompute = updates,
+    )
+    return len(scores)
@@ -0,0 +1,148 @@
+import collections
+import datetime
+
+import beeline
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import Response, ResponseRollup
+
+# Responses are counted per user and hour. Windows start at the top of an
+# hour, so e.g. the last 7 days may include up to an hour more than that.
+def period_start(t):
+    return t.replace(minute=0, second=0, microsecond=0)
+
+@beeline.traced(name="record_rollup")
+def record_response(user, creation_time, confidence_percent, correct):
+    # Like calibration.record_response, this relies on the caller holding
+    # the lock on the user's UserCalibration row.
+    start = period_start(creation_time)
+    updated = ResponseRollup.objects.filter(
+        user = user,
+        period_start = start,
+    ).update(
+        answers = F("answers") + 1,
+        correct_answers = F("correct_answers") + int(correct),
+        confidence_percent_sum = F("confidence_percent_sum") + confidence_percent,
+    )
+    if not updated:
+        ResponseRollup.objects.create(
+            user = user,
+            period_start = start,
+            answers = 1,
+            correct_answers = int(correct),
+            confidence_percent_sum = confidence_percent,
+        )
+
+def _window_start(days, now=None):
+    now = now or timezone.now()
+    return period_start(now - datetime.timedelta(days=days))
+
+@beeline.traced(name="get_window_stats")
+def get_window_stats(user, windows, now=None):
+    # Totals over the last few days, for each number of days in windows, in
+    # one query.
+    starts = {days: _window_start(days, now) for days in windows}
+    annotations = {}
+    for days, start in starts.items():
+        q = Q(period_start__gte = start)
+        annotations[f"answers_{days}"] = Sum("answers", filter = q)
+        annotations[f"correct_{days}"] = Sum("correct_answers", filter = q)
+        annotations[f"confidence_{days}"] = Sum("confidence_percent_sum", filter = q)
+    row = ResponseRollup.objects.filter(
+        user = user,
+        period_start__gte = min(starts.values()),
+    ).aggregate(**annotations)
+    return {
+        days: {
+            "number_of_answers": row[f"answers_{days}"] or 0,
+            "number_of_correct_answers": row[f"correct_{days}"] or 0,
+            "expected_correct_answers": (row[f"confidence_{days}"] or 0) / 100,
+            "plausibility": None,
+        }
+        for days in windows
+    }
+
+@beeline.traced(name="get_daily_trend")
+def get_daily_trend(user, days, now=None):
+    # (date, answers, correct answers, confidence sum) per day with
+    # responses, oldest first. Days are in UTC.
+    return list(ResponseRollup.objects.filter(
+        user = user,
+        period_start__gte = _window_start(days, now),
+    ).annotate(
+        day = TruncDate("period_start"),
+    ).order_by().values("day").annotate(
+        n = Sum("answers"),
+        n_correct = Sum("correct_answers"),
+        confidence_sum = Sum("confidence_percent_sum"),
+    ).order_by("day").values_list("day", "n", "n_correct", "confidence_sum"))
+
+def compute_rollups(user_ids=None):
+    # {user id: {period start: (answers, correct answers, confidence sum)}},
+    # computed from the responses.
+    qs = Response.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in = user_ids)
+    rows = qs.annotate(
+        period_start = TruncHour("creation_time"),
+    ).order_by().values("user", "period_start").annotate(
+        n = Count("pk"),
+        n_correct = Count("pk", filter = Q(correct = True)),
+        confidence_sum = Sum("confidence_percent"),
+    ).values_list("user", "period_start", "n", "n_correct", "confidence_sum")
+
+    rv = collections.defaultdict(dict)
+    for user_id, start, n, n_correct, confidence_sum in rows.iterator():
+        rv[user_id][start] = (n, n_correct, confidence_sum)
+    return dict(rv)
+
+@beeline.traced(name="rebuild_rollups")
+@transaction.atomic
+def rebuild(user_ids=None):
+    rollups = compute_rollups(user_ids)
+
+    qs = ResponseRollup.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in = user_ids)
+    qs.delete()
+
+    ResponseRollup.objects.bulk_create([
+        ResponseRollup(
+            user_id = user_id,
+            period_start = start,
+            answers = n,
+            correct_answers = n_correct,
+            confidence_percent_sum = confidence_sum,
+        )
+        for user_id, periods in rollups.items()
+        for start, (n, n_correct, confidence_sum) in periods.items()
+    ], batch_size=1000)
+    return len(rollups)
+
+@beeline.traced(name="check_rollups")
+def check(user_ids=None):
+    # Returns (user id, description) for every user whose rollups disagree
+    # with the responses.
+    expected = compute_rollups(user_ids)
+
+    qs = ResponseRollup.objects.filter(answers__gt = 0)
+    if user_ids is not None:
+        qs = qs.filter(user_id__in = user_ids)
+    stored = collections.defaultdict(dict)
+    for user_id, start, n, n_correct, confidence_sum in qs.values_list(
+        "user", "period_start", "answers", "correct_answers", "confidence_percent_sum",
+    ).iterator():
+        stored[user_id][start] = (n, n_correct, confidence_sum)
+
+    rv = []
+    for user_id in sorted(set(expected) | set(stored)):
+        want = expected.get(user_id, {})
+        have = stored.get(user_id, {})
+        for start in sorted(set(want) | set(have)):
+            if have.get(start) != want.get(start):
+                rv.append((user_id, f"rollup for {start:%Y-%m-%d %H:%M} is {have.get(start)}, expected {want.get(start)}"))
+    return rv
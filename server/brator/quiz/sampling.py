@@ -0,0 +1,184 @@
+import array
+import collections
+import logging
+import threading
+import time
+
+import beeline
+
+from .models import Fact, FactCategory
+
+logger = logging.getLogger(__name__)
+
+# Other workers can change the fact set without us seeing a signal, and not
+# every such change shows up in the category counters (e.g. a fact replaced
+# by a new version), so the index is also rebuilt periodically.
+INDEX_MAX_AGE_SECONDS = 300
+
+MAX_REJECTIONS = 16
+
+class AliasTable:
+    # Vose's alias method: O(n) to build, O(1) per weighted draw.
+
+    def __init__(self, weights):
+        n = len(weights)
+        weights = [float(w) for w in weights]
+        total = sum(weights)
+        if total <= 0:
+            weights = [1.0] * n
+            total = float(n)
+
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, x in enumerate(scaled) if x < 1]
+        large = [i for i, x in enumerate(scaled) if x >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng):
+        i = rng.randrange(len(self.prob))
+        if rng.random() < self.prob[i]:
+            return i
+        return self.alias[i]
+
+def _load_category_signature():
+    return tuple(
+        FactCategory.objects.filter(
+            active_fact_count__gt = 0,
+        ).order_by("pk").values_list("pk", "name", "weight", "active_fact_count")
+    )
+
+class FactSamplingIndex:
+    def __init__(self, signature, fact_ids):
+        self.signature = signature
+        self.categories = [row for row in signature if fact_ids.get(row[0])]
+        self.fact_ids = fact_ids
+        if self.categories:
+            self.pools = [(pk, weight) for pk, _, weight, _ in self.categories]
+        elif fact_ids.get(None):
+            self.pools = [(None, 1)]
+        else:
+            self.pools = []
+        self.pool_table = AliasTable([weight for _, weight in self.pools])
+        self.built_at = time.monotonic()
+
+    @classmethod
+    @beeline.traced(name="build_fact_sampling_index")
+    def build(cls, signature):
+        fact_ids = collections.defaultdict(lambda: array.array("q"))
+        rows = Fact.objects.filter(active=True).values_list("category_id", "id").order_by()
+        for category_id, fact_id in rows.iterator(chunk_size=10000):
+            fact_ids[category_id].append(fact_id)
+        rv = cls(signature, dict(fact_ids))
+        logger.info(
+            "Built fact sampling index: categories: %s, uncategorized: %d",
+            [(name, float(weight), len(rv.fact_ids[pk])) for pk, name, weight, _ in rv.categories],
+            len(rv.fact_ids.get(None, ())),
+        )
+        return rv
+
+    @property
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    def sample(self, rng, exclude=None):
+        if exclude is not None:
+            return self.sampler(rng, exclude.copy()).sample()
+
+        if not self.pools:
+            return None
+        ids = self.fact_ids[self.pools[self.pool_table.sample(rng)][0]]
+        return ids[rng.randrange(len(ids))]
+
+    def sampler(self, rng, exclude):
+        # For drawing several facts not in exclude; every fact drawn is added
+        # to exclude.
+        return ExcludingSampler(self, rng, exclude)
+
+class ExcludingSampler:
+    def __init__(self, index, rng, exclude):
+        self.index = index
+        self.rng = rng
+        self.exclude = exclude
+        # Once rejection sampling keeps hitting excluded facts, the facts
+        # that can still be drawn, per pool; built at most once.
+        self.pools = None
+        self.unseen = None
+        self.table = None
+
+    def _build_unseen(self):
+        self.pools = []
+        self.unseen = []
+        for pool in self.index.pools:
+            ids = [x for x in self.index.fact_ids[pool[0]] if x not in self.exclude]
+            if ids:
+                self.pools.append(pool)
+                self.unseen.append(ids)
+        self.table = AliasTable([weight for _, weight in self.pools])
+
+    def _take(self, fact_id):
+        self.exclude.add(fact_id)
+        return fact_id
+
+    def sample(self):
+        if not self.index.pools:
+            return None
+
+        if self.unseen is None:
+            for _ in range(MAX_REJECTIONS):
+                fact_id = self.index.sample(self.rng)
+                if fact_id not in self.exclude:
+                    return self._take(fact_id)
+            self._build_unseen()
+
+        # Sample exactly among the remaining facts, dropping pools as they
+        # run out.
+        while self.pools:
+            i = self.table.sample(self.rng)
+            ids = self.unseen[i]
+            if ids:
+                j = self.rng.randrange(len(ids))
+                ids[j], ids[-1] = ids[-1], ids[j]
+                return self._take(ids.pop())
+            self.pools.pop(i)
+            self.unseen.pop(i)
+            self.table = AliasTable([weight for _, weight in self.pools])
+        return None
+
+_lock = threading.Lock()
+_index = None
+
+def invalidate_index():
+    global _index
+    _index = None
+
+def get_index(force_rebuild=False):
+    global _index
+    # The category counters are a cheap way to notice facts added or retired
+    # by other workers.
+    signature = _load_category_signature()
+    index = _index
+    if (
+        index is not None
+        and not force_rebuild
+        and index.signature == signature
+        and index.age < INDEX_MAX_AGE_SECONDS
+    ):
+        return index
+    with _lock:
+        if _index is index or _index is None:
+            _index = FactSamplingIndex.build(signature)
+        return _index
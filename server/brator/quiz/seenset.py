@@ -0,0 +1,70 @@
+import collections
+import threading
+
+from .models import SeenFactSet
+
+MAX_CACHED_USERS = 1024
+
+class FactBitmap:
+    def __init__(self, data=b""):
+        self.bits = bytearray(data)
+
+    def __contains__(self, fact_id):
+        i = fact_id >> 3
+        return i < len(self.bits) and bool(self.bits[i] & (1 << (fact_id & 7)))
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, "little")).count("1")
+
+    def add(self, fact_id):
+        i = fact_id >> 3
+        if i >= len(self.bits):
+            self.bits.extend(bytes(i + 1 - len(self.bits)))
+        self.bits[i] |= 1 << (fact_id & 7)
+
+    def copy(self):
+        return FactBitmap(self.bits)
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+_lock = threading.Lock()
+_cache = collections.OrderedDict()
+
+def _cache_put(user_id, version, bitmap):
+    with _lock:
+        _cache[user_id] = (version, bitmap)
+        _cache.move_to_end(user_id)
+        while len(_cache) > MAX_CACHED_USERS:
+            _cache.popitem(last=False)
+
+def load_seen_facts(user):
+    # The returned bitmap may be shared with the cache; copy() before modifying.
+    version = SeenFactSet.objects.filter(user = user).values_list("version", flat=True).first()
+    if version is None:
+        return FactBitmap()
+
+    cached = _cache.get(user.pk)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    version, data = SeenFactSet.objects.filter(user = user).values_list("version", "bitmap").get()
+    bitmap = FactBitmap(data)
+    _cache_put(user.pk, version, bitmap)
+    return bitmap
+
+def mark_fact_seen(user, fact_id):
+    # Rewrites the whole bitmap, one bit per fact id up to the largest one
+    # seen: about 6 kB per answer with 50k fact ids. One row per seen fact
+    # would make this constant, but then a cache miss has to read all of
+    # the user's rows to rebuild the bitmap.
+    row, _ = SeenFactSet.objects.select_for_update().get_or_create(user = user)
+    bitmap = FactBitmap(row.bitmap)
+    if fact_id in bitmap:
+        return False
+    bitmap.add(fact_id)
+    row.bitmap = bitmap.to_bytes()
+    row.version += 1
+    SeenFactSet.objects.filter(pk = row.pk).update(bitmap = row.bitmap, version = row.version)
+    _cache_put(user.pk, row.version, bitmap)
+    return True
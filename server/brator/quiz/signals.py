@@ -1,6 +1,43 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
+import collections
+import logging
+
+from .models import Fact, FactCategory, adjust_active_fact_counts, recount_active_facts
+from . import sampling
+from . import validation
+
+logger = logging.getLogger(__name__)
+
 @receiver(pre_save)
 def validate_model(instance, **kwargs):
-    instance.clean()
+    validation.validate(instance)
+
+@receiver(post_save, sender=Fact)
+@receiver(post_delete, sender=Fact)
+@receiver(post_save, sender=FactCategory)
+@receiver(post_delete, sender=FactCategory)
+def invalidate_sampling_index(**kwargs):
+    sampling.invalidate_index()
+
+@receiver(post_save, sender=Fact)
+def count_saved_fact(instance, created, **kwargs):
+    if not created and not hasattr(instance, "_counted_category_id"):
+        logger.info("Saved fact %s without known previous state; recounting category.", instance.pk)
+        recount_active_facts([instance.category_id])
+        instance.remember_counted_category()
+        return
+    old_category_id = None if created else instance._counted_category_id
+    new_category_id = instance.counted_category_id
+    if old_category_id != new_category_id:
+        deltas = collections.Counter()
+        deltas[old_category_id] -= 1
+        deltas[new_category_id] += 1
+        adjust_active_fact_counts(deltas)
+    instance.remember_counted_category()
+
+@receiver(post_delete, sender=Fact)
+def count_deleted_fact(instance, **kwargs):
+    category_id = getattr(instance, "_counted_category_id", None)
+    adjust_active_fact_counts({category_id: -1})
@@ -1,10 +1,50 @@
 import cmath
+import collections
+import functools
 import math
 
 import beeline
+import numpy as np
 
 MIN_DATA_POINTS = 5
-MAX_DATA_POINTS_EXACT = 50
+
+# Up to this many data points the PMF is computed exactly; beyond it a
+# refined normal approximation is used.
+MAX_DATA_POINTS_EXACT = 100_000
+
+# Below this size the direct FFT method is faster than the product tree.
+MAX_DATA_POINTS_DIRECT = 128
+
+# How many levels of the product tree are computed on stacked arrays
+# rather than polynomial by polynomial.
+PRODUCT_TREE_STACKED_LEVELS = 5
+
+# Below this size convolutions are done directly rather than by FFT.
+MAX_DIRECT_CONVOLUTION = 512
+
+# Use the grouped method when each distinct probability occurs this many
+# times on average; confidences are quantized, so this is the usual case.
+MIN_MEAN_GROUP_SIZE = 10
+
+GROUPED_PMF_CACHE_SIZE = 256
+
+MIN_LOG_CHARACTERISTIC = -700.0
+
+# Groups up to this size share one batched PMF computation; see
+# calculate_plausibilities_from_histograms.
+MAX_DATA_POINTS_BATCHED = 1000
+
+# Tails of an incrementally maintained PMF holding less than this much
+# probability mass are dropped.
+PMF_TAIL_MASS = 1e-15
+
+# Shevtsova's constant in the Berry-Esseen bound for sums of independent,
+# non-identically distributed variables.
+BERRY_ESSEEN_CONSTANT = 0.56
+
+# Number of probabilities multiplied into the characteristic function at a
+# time; bounds the size of the intermediate (n+1) x block matrix.
+PMF_BLOCK_SIZE = 256
 
 MIN_PROBABILITY = 0.001
 MAX_PROBABILITY = (1 - MIN_PROBABILITY)
@@ -37,47 +77,317 @@ def poisson_binomial_dft_pmf(ps, k):
     rv += clk * el
   return rv.real / (len(ps) + 1)
 
-@beeline.traced(name="calculate_plausibility_of")
-def calculate_plausibility_of(confidence_correctness):
-    if len(confidence_correctness) < MIN_DATA_POINTS:
+@beeline.traced(name="poisson_binomial_pmf")
+def poisson_binomial_pmf(ps):
+    # Same DFT method as poisson_binomial_dft_pmf, for every k at once: the
+    # characteristic function is evaluated at all n+1 roots of unity and
+    # the whole PMF recovered with a single FFT.
+    ps = np.array([float(p) for p in ps], dtype=float)
+    n = len(ps)
+    roots_minus_one = np.exp(2j * np.pi * np.arange(n + 1) / (n + 1)) - 1
+    phi = np.ones(n + 1, dtype=complex)
+    for i in range(0, n, PMF_BLOCK_SIZE):
+        phi *= np.prod(1 + np.outer(roots_minus_one, ps[i:i+PMF_BLOCK_SIZE]), axis=1)
+    return np.fft.fft(phi).real / (n + 1)
+
+def _convolve(a, b):
+    n = len(a) + len(b) - 1
+    if min(len(a), len(b)) <= MAX_DIRECT_CONVOLUTION:
+        return np.convolve(a, b)
+    size = 1 << (n - 1).bit_length()
+    rv = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)[:n]
+    return np.clip(rv, 0, None)
+
+def _convolve_pairs(polys):
+    # Convolves rows 2i and 2i+1 of a stack of equal-length polynomials.
+    a, b = polys[0::2], polys[1::2]
+    rv = np.zeros((len(a), 2 * polys.shape[1] - 1))
+    for j in range(b.shape[1]):
+        rv[:, j:j + a.shape[1]] += a * b[:, j:j + 1]
+    return rv
+
+@beeline.traced(name="poisson_binomial_pmf_product_tree")
+def poisson_binomial_pmf_product_tree(ps):
+    # Multiplies the generating polynomials (1-p) + p*x pairwise, so the
+    # work is O(n log^2 n) with FFT convolutions.
+    ps = np.array([float(p) for p in ps], dtype=float)
+    if not len(ps):
+        return np.ones(1)
+
+    # The lowest levels of the tree are done on all polynomials at once.
+    # Padding with p = 0 multiplies by 1.
+    n = len(ps)
+    leaves = 1 << min(PRODUCT_TREE_STACKED_LEVELS, (n - 1).bit_length())
+    ps = np.concatenate([ps, np.zeros(-n % leaves)])
+    stack = np.stack([1 - ps, ps], axis=1)
+    while len(stack) > 1 and stack.shape[1] <= leaves:
+        stack = _convolve_pairs(stack)
+
+    polys = list(stack)
+    while len(polys) > 1:
+        merged = [_convolve(a, b) for a, b in zip(polys[0::2], polys[1::2])]
+        if len(polys) % 2:
+            merged.append(polys[-1])
+        polys = merged
+    pmf = polys[0][:n + 1]
+    return pmf / pmf.sum()
+
+def _binomial_pmf(n, p):
+    # Computed in log space, since the binomial coefficients overflow and
+    # the powers underflow long before the probabilities themselves do.
+    ks = np.arange(n + 1)
+    log_coefficients = np.concatenate([[0.0], np.cumsum(np.log(np.arange(n, 0, -1) / ks[1:]))])
+    return np.exp(log_coefficients + ks * math.log(p) + (n - ks) * math.log1p(-p))
+
+def _normalize_histogram(histogram):
+    # The canonical, hashable form of a histogram: sorted (probability,
+    # count) pairs with each probability occurring once.
+    counts = collections.Counter()
+    for p, count in histogram:
+        if count:
+            counts[float(p)] += count
+    return tuple(sorted(counts.items()))
+
+@functools.lru_cache(maxsize=GROUPED_PMF_CACHE_SIZE)
+def _poisson_binomial_pmf_grouped(histogram):
+    polys = [_binomial_pmf(count, p) for p, count in histogram]
+    if not polys:
+        return np.ones(1)
+    while len(polys) > 1:
+        merged = [_convolve(a, b) for a, b in zip(polys[0::2], polys[1::2])]
+        if len(polys) % 2:
+            merged.append(polys[-1])
+        polys = merged
+    pmf = polys[0] / polys[0].sum()
+    pmf.flags.writeable = False
+    return pmf
+
+@beeline.traced(name="poisson_binomial_pmf_grouped")
+def poisson_binomial_pmf_grouped(histogram):
+    # The sum of the Bernoulli variables sharing a probability is binomial,
+    # so only one convolution per distinct probability is needed, and the
+    # work is O(distinct * n). Results are cached by histogram and must not
+    # be modified.
+    return _poisson_binomial_pmf_grouped(_normalize_histogram(histogram))
+
+@beeline.traced(name="poisson_binomial_pmfs_batched")
+def poisson_binomial_pmfs_batched(histograms):
+    # The PMFs for several histograms of (probability, count) pairs at once.
+    # Every group's characteristic function is evaluated at the same n+1
+    # roots of unity, n being the largest group: its log is one (groups x
+    # probabilities) by (probabilities x roots) matrix product, and one FFT
+    # along the last axis recovers all the PMFs.
+    histograms = [
+        _normalize_histogram((_clamp_probability(p), count) for p, count in histogram)
+        for histogram in histograms
+    ]
+    sizes = [sum(count for _, count in histogram) for histogram in histograms]
+    if not histograms:
+        return []
+
+    ps = sorted({p for histogram in histograms for p, _ in histogram})
+    column = {p: i for i, p in enumerate(ps)}
+    counts = np.zeros((len(histograms), len(ps)))
+    for i, histogram in enumerate(histograms):
+        for p, count in histogram:
+            counts[i, column[p]] = count
+
+    n = max(sizes)
+    roots = np.exp(2j * np.pi * np.arange(n + 1) / (n + 1))
+    ps = np.array(ps)
+    log_factors = np.log(1 - ps[:, None] + ps[:, None] * roots[None, :])
+    log_phi = counts @ log_factors
+    # Values this small are zero for our purposes, and would hit numpy's
+    # slow underflow path.
+    log_phi.real = np.maximum(log_phi.real, MIN_LOG_CHARACTERISTIC)
+    pmfs = np.fft.fft(np.exp(log_phi), axis=1).real / (n + 1)
+    return [np.clip(pmfs[i, :size + 1], 0, None) for i, size in enumerate(sizes)]
+
+def _normal_cdf(x):
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+def _normal_pdf(x):
+    return math.exp(-x * x / 2) / math.sqrt(2 * math.pi)
+
+@beeline.traced(name="poisson_binomial_refined_normal")
+def poisson_binomial_refined_normal(histogram):
+    # Refined normal approximation (Volkova 1996) of the CDF, with the
+    # Berry-Esseen bound on the error of the normal approximation.
+    ps = np.array([float(p) for p, _ in histogram], dtype=float)
+    counts = np.array([count for _, count in histogram], dtype=float)
+    n = int(counts.sum())
+    qs = 1 - ps
+    mu = float((counts * ps).sum())
+    sigma = math.sqrt(float((counts * ps * qs).sum()))
+    gamma = float((counts * ps * qs * (qs - ps)).sum()) / sigma ** 3
+    third_moment = (counts * ps * qs * (ps ** 2 + qs ** 2)).sum()
+    error_bound = min(1.0, float(BERRY_ESSEEN_CONSTANT * third_moment / sigma ** 3))
+
+    def cdf(k):
+        if k < 0:
+            return 0.0
+        if k >= n:
+            return 1.0
+        x = (k + 0.5 - mu) / sigma
+        rv = _normal_cdf(x) + gamma * (1 - x * x) * _normal_pdf(x) / 6
+        return min(1.0, max(0.0, rv))
+
+    return cdf, error_bound
+
+def _exact_pmf(histogram, n):
+    if len(histogram) * MIN_MEAN_GROUP_SIZE <= n:
+        return "poisson-binomial-grouped", poisson_binomial_pmf_grouped(histogram)
+    probs = [p for p, count in histogram for _ in range(count)]
+    if n <= MAX_DATA_POINTS_DIRECT:
+        return "poisson-binomial-fft", poisson_binomial_pmf(probs)
+    return "poisson-binomial-product-tree", poisson_binomial_pmf_product_tree(probs)
+
+@beeline.traced(name="calculate_plausibility_from_histogram")
+def calculate_plausibility_from_histogram(histogram, num_correct, max_exact=MAX_DATA_POINTS_EXACT):
+    # histogram is an iterable of (confidence, number of answers) pairs.
+    histogram = _normalize_histogram(
+        (_clamp_probability(conf), count) for conf, count in histogram
+    )
+    n = sum(count for _, count in histogram)
+
+    if n < MIN_DATA_POINTS:
         return None
+    if not (0 <= num_correct <= n):
+        raise ValueError(f"bad number of correct answers: {num_correct} of {n}")
+
+    if n > max_exact:
+        cdf, error_bound = poisson_binomial_refined_normal(histogram)
+        prob_fewer = cdf(num_correct - 1)
+        prob_more = 1 - cdf(num_correct)
+        return {
+            "method": "refined-normal-approximation",
+            "error_bound": error_bound,
+            "prob_fewer": prob_fewer,
+            "prob_same": 1 - prob_fewer - prob_more,
+            "prob_more": prob_more,
+        }
 
-    if len(confidence_correctness) > MAX_DATA_POINTS_EXACT:
+    method, pmfs = _exact_pmf(histogram, n)
+
+    prob_same = float(pmfs[num_correct])
+
+    if num_correct == 0:
+        prob_fewer = 0
+        prob_more = 1 - prob_same
+    elif num_correct == n:
+        prob_more = 0
+        prob_fewer = 1 - prob_same
+    else:
+        prob_fewer = float(pmfs[:num_correct].sum())
+        prob_more = float(pmfs[num_correct+1:].sum())
+
+    return {
+        "method": method,
+        "prob_fewer": prob_fewer,
+        "prob_same": prob_same,
+        "prob_more": prob_more,
+    }
+
+@beeline.traced(name="calculate_plausibility_of")
+def calculate_plausibility_of(confidence_correctness, max_exact=MAX_DATA_POINTS_EXACT):
+    if len(confidence_correctness) < MIN_DATA_POINTS:
         return None
 
-    probs = []
-    corrs = []
+    histogram = collections.Counter()
+    num_correct = 0
 
     for conf, correctness in confidence_correctness:
         if not (0 <= conf <= 1):
             raise ValueError(f"bad confidence: {conf}")
         if correctness not in (True, False, 0, 1):
             raise ValueError(f"bad correctness: {correctness}")
-        probs.append(float(_clamp_probability(conf)))
-        corrs.append(int(correctness))
+        histogram[float(conf)] += 1
+        num_correct += int(correctness)
 
-    pmfs = []
+    return calculate_plausibility_from_histogram(histogram.items(), num_correct, max_exact)
 
-    num_correct = sum(corrs)
+def pmf_from_histogram(histogram):
+    # The exact PMF of the number of correct answers for a histogram of
+    # (confidence, number of answers) pairs.
+    histogram = _normalize_histogram(
+        (_clamp_probability(conf), count) for conf, count in histogram
+    )
+    n = sum(count for _, count in histogram)
+    return _exact_pmf(histogram, n)[1]
 
-    for k in range(0, len(probs)+1):
-        pmfs.append(poisson_binomial_dft_pmf(probs, k))
+def trim_pmf(pmf, offset, tail_mass=PMF_TAIL_MASS):
+    # A PMF is stored as (pmf, offset), where pmf[i] is the probability of
+    # offset + i successes. Drops the negligible tails at either end.
+    low = int(np.searchsorted(np.cumsum(pmf), tail_mass, side="right"))
+    high = int(np.searchsorted(np.cumsum(pmf[::-1]), tail_mass, side="right"))
+    if low + high >= len(pmf):
+        return pmf, offset
+    return pmf[low:len(pmf) - high], offset + low
 
-    prob_same = pmfs[num_correct]
+def multiply_pmf(pmf, p):
+    # Multiplies the generating polynomial by (1-p) + p*x in O(n).
+    p = float(_clamp_probability(p))
+    rv = np.zeros(len(pmf) + 1)
+    rv[:-1] += pmf * (1 - p)
+    rv[1:] += pmf * p
+    return rv
 
-    if num_correct == 0:
-        prob_fewer = 0
-        prob_more = 1 - prob_same
-    elif num_correct == len(probs):
-        prob_more = 0
-        prob_fewer = 1 - prob_same
+def divide_pmf(pmf, p):
+    # Divides the generating polynomial by (1-p) + p*x in O(n), undoing
+    # multiply_pmf. The recurrence runs from whichever end keeps rounding
+    # errors from growing: dividing by the larger of the two coefficients.
+    p = float(_clamp_probability(p))
+    q = 1 - p
+    n = len(pmf) - 1
+    rv = np.zeros(n)
+    c = 0.0
+    if p <= q:
+        for k in range(n):
+            c = (pmf[k] - p * c) / q
+            rv[k] = c
     else:
-        prob_fewer = sum(pmfs[:num_correct])
-        prob_more = sum(pmfs[num_correct+1:])
+        for k in range(n, 0, -1):
+            c = (pmf[k] - q * c) / p
+            rv[k - 1] = c
+    return rv
 
+def add_to_pmf(pmf, offset, p, tail_mass=PMF_TAIL_MASS):
+    return trim_pmf(multiply_pmf(pmf, p), offset, tail_mass)
+
+def plausibility_from_pmf(pmf, offset, num_correct, method="poisson-binomial-incremental"):
+    # Mass cut from the tails counts as zero.
+    k = num_correct - offset
+    prob_fewer = float(pmf[:max(k, 0)].sum())
+    prob_same = float(pmf[k]) if 0 <= k < len(pmf) else 0.0
+    prob_more = float(pmf[max(k + 1, 0):].sum())
     return {
-        "method": "poisson-binomial-dft-pmf",
+        "method": method,
         "prob_fewer": prob_fewer,
         "prob_same": prob_same,
         "prob_more": prob_more,
     }
+
+@beeline.traced(name="calculate_plausibilities_from_histograms")
+def calculate_plausibilities_from_histograms(groups):
+    # Like calculate_plausibility_from_histogram for a list of (histogram,
+    # num_correct) pairs. The small groups are computed together in one
+    # batch, since padding them to a common length is cheaper than one FFT
+    # each; the rest are computed one by one.
+    rv = [None] * len(groups)
+    batch = []
+    for i, (histogram, num_correct) in enumerate(groups):
+        histogram = list(histogram)
+        n = sum(count for _, count in histogram)
+        if n < MIN_DATA_POINTS:
+            continue
+        if not (0 <= num_correct <= n):
+            raise ValueError(f"bad number of correct answers: {num_correct} of {n}")
+        if n <= MAX_DATA_POINTS_BATCHED:
+            batch.append((i, histogram, num_correct))
+        else:
+            rv[i] = calculate_plausibility_from_histogram(histogram, num_correct)
+
+    pmfs = poisson_binomial_pmfs_batched([histogram for _, histogram, _ in batch])
+    for (i, _, num_correct), pmf in zip(batch, pmfs):
+        rv[i] = plausibility_from_pmf(pmf, 0, num_correct, method="poisson-binomial-batched")
+    return rv
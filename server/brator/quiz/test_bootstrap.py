@@ -0,0 +1,41 @@
+import decimal
+
+from .bootstrap import bootstrap_calibration
+
+CELLS = [
+    (decimal.Decimal("60"), True, 40),
+    (decimal.Decimal("60"), False, 20),
+    (decimal.Decimal("65.5"), True, 5),
+    (decimal.Decimal("90"), True, 300),
+    (decimal.Decimal("90"), False, 35),
+]
+
+def test_estimates():
+    rv = bootstrap_calibration(CELLS, 10)
+    n = 400
+    assert abs(rv["correct_percent"]["estimate"] - 100 * 345 / n) < 1e-9
+    assert abs(rv["mean_confidence_percent"]["estimate"] - (60 * 60 + 65.5 * 5 + 90 * 335) / n) < 1e-9
+    brier = (40 * 0.4 ** 2 + 20 * 0.6 ** 2 + 5 * 0.345 ** 2 + 300 * 0.1 ** 2 + 35 * 0.9 ** 2) / n
+    assert abs(rv["brier_score"]["estimate"] - brier) < 1e-9
+    for name in ["correct_percent", "mean_confidence_percent", "overconfidence_percent", "brier_score", "log_score"]:
+        assert rv[name]["low"] < rv[name]["estimate"] < rv[name]["high"]
+
+def test_interval_width():
+    # The bootstrap standard error of a hit rate is close to sqrt(p(1-p)/n).
+    rv = bootstrap_calibration(CELLS, 10)
+    p = 345 / 400
+    width = rv["correct_percent"]["high"] - rv["correct_percent"]["low"]
+    assert abs(width - 2 * 1.96 * 100 * (p * (1 - p) / 400) ** 0.5) < 1
+
+def test_calibration_curve_bands():
+    curve = bootstrap_calibration(CELLS, 10)["calibration_curve"]
+    assert [row["bin_low"] for row in curve] == [60, 90]
+    assert curve[0]["correct_percent_low"] < 100 * 45 / 65 < curve[0]["correct_percent_high"]
+
+def test_reproducible():
+    assert bootstrap_calibration(CELLS, 10) == bootstrap_calibration(CELLS, 10)
+    assert bootstrap_calibration(CELLS, 10) != bootstrap_calibration(CELLS, 10, seed=1)
+
+def test_no_data():
+    assert bootstrap_calibration([], 10) is None
+    assert bootstrap_calibration([(decimal.Decimal("60"), True, 0)], 10) is None
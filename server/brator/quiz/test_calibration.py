@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from . import calibration, stats
+from .models import CalibrationBucket, Response, UserCalibration
+from .testutils import answer_challenge, create_regular_user, create_numeric_fact
+
+class CalibrationTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        create_numeric_fact()
+
+    def _answer_some(self):
+        for i in range(12):
+            answer_challenge(self.user, [60, 90, 90][i % 3], i % 5 != 0)
+
+    def test_aggregates_follow_responses(self):
+        self._answer_some()
+        row = UserCalibration.objects.get(user = self.user)
+        responses = list(Response.objects.filter(user = self.user))
+        assert row.answers == 12
+        assert row.correct_answers == sum(r.correct for r in responses)
+        assert row.confidence_percent_sum == sum(r.confidence_percent for r in responses)
+        assert calibration.get_histogram(self.user) == calibration.compute_histograms()[self.user.pk]
+        assert [conf for conf, _, _ in calibration.get_histogram(self.user)] == [60, 90]
+        assert calibration.check() == []
+
+    def test_stored_pmf(self):
+        self._answer_some()
+        row = UserCalibration.objects.get(user = self.user)
+        pmf, offset = calibration.load_pmf(row)
+        expected = stats.pmf_from_histogram([(0.6, 4), (0.9, 8)])
+        assert abs(pmf - expected[offset:offset + len(pmf)]).max() < 1e-12
+
+        UserCalibration.objects.update(pmf = b"")
+        answer_challenge(self.user, 60, True)
+        pmf, offset = calibration.load_pmf(UserCalibration.objects.get(user = self.user))
+        expected = stats.pmf_from_histogram([(0.6, 5), (0.9, 8)])
+        assert abs(pmf - expected[offset:offset + len(pmf)]).max() < 1e-12
+        assert calibration.check() == []
+
+    def test_check_detects_bad_pmf(self):
+        self._answer_some()
+        UserCalibration.objects.update(pmf_offset = 1)
+        assert "PMF" in calibration.check()[0][1]
+
+    def test_check_and_rebuild(self):
+        self._answer_some()
+        CalibrationBucket.objects.filter(confidence_percent = 60).delete()
+        problems = calibration.check()
+        assert [user_id for user_id, _ in problems] == [self.user.pk]
+
+        with pytest.raises(CommandError):
+            call_command("check_calibration", stdout=io.StringIO())
+
+        call_command("rebuild_calibration", stdout=io.StringIO())
+        assert calibration.check() == []
+        out = io.StringIO()
+        call_command("check_calibration", stdout=out)
+        assert "consistent" in out.getvalue()
+
+    def test_rebuild_for_one_user(self):
+        self._answer_some()
+        other = create_regular_user("other")
+        UserCalibration.objects.create(user = other, answers = 3)
+        calibration.rebuild([self.user.pk])
+        assert [user_id for user_id, _ in calibration.check()] == [other.pk]
+        calibration.rebuild([other.pk])
+        assert calibration.check() == []
+        assert not UserCalibration.objects.filter(user = other).exists()
+
+    def test_calibration_curve(self):
+        self._answer_some()
+        answer_challenge(self.user, 65, True)
+        curve = calibration.get_calibration_curve(self.user)
+        assert [(row["bin_low"], row["answers"], row["correct_answers"]) for row in curve] == [(60, 5, 4), (90, 8, 6)]
+        assert curve[0]["mean_confidence_percent"] == 61
+        assert curve[1]["correct_percent"] == 75
+
+        with self.assertNumQueries(1):
+            assert calibration.get_calibration_curve(self.user) == curve
+
+        answer_challenge(self.user, 99, True)
+        curve = calibration.get_calibration_curve(self.user)
+        assert curve[-1]["bin_low"] == 90
+        assert curve[-1]["answers"] == 9
+
+    def test_calibration_bands_are_cached(self):
+        assert calibration.get_calibration_bands(self.user) is None
+        self._answer_some()
+        bands = calibration.get_calibration_bands(self.user)
+        assert [row["bin_low"] for row in bands["calibration_curve"]] == [60, 90]
+        with self.assertNumQueries(1):
+            assert calibration.get_calibration_bands(self.user) == bands
+        answer_challenge(self.user, 60, True)
+        assert calibration.get_calibration_bands(self.user) != bands
@@ -0,0 +1,68 @@
+import datetime
+
+import numpy as np
+
+from django.test import TestCase
+from django.utils import timezone
+
+from . import charts, logic
+from .models import SummaryScore
+from .testutils import create_regular_user
+
+def test_lttb_short_series():
+    assert list(charts.lttb([1, 2, 3], [5, 6, 7], 10)) == [0, 1, 2]
+
+def test_lttb_keeps_endpoints_and_peaks():
+    xs = np.arange(1000)
+    ys = np.zeros(1000)
+    ys[123] = 10
+    ys[777] = -5
+    indices = charts.lttb(xs, ys, 20)
+    assert len(indices) == 20
+    assert indices[0] == 0 and indices[-1] == 999
+    assert all(np.diff(indices) > 0)
+    assert 123 in indices and 777 in indices
+
+def test_lttb_multiple_series():
+    xs = np.arange(500)
+    ys = np.zeros((500, 2))
+    ys[321, 1] = 1
+    assert 321 in charts.lttb(xs, ys, 10)
+
+def test_calibration_chart_is_downsampled():
+    start = timezone.now()
+    rows = [
+        (start + datetime.timedelta(hours=i), 0.2, 0.5, 0.3)
+        for i in range(1000)
+    ]
+    data = charts.calibration_chart_data(rows, "title", max_points=50)
+    assert len(data["data"]["labels"]) == 50
+    assert all(len(dataset["data"]) == 50 for dataset in data["data"]["datasets"])
+
+class SummaryChartTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+
+    def _add_score(self, same):
+        SummaryScore.objects.create(
+            user = self.user,
+            batch_size = 20,
+            actual_correct = 10,
+            expected_correct = 10,
+            probability_fewer_correct = (1 - same) / 2,
+            probability_same_correct = same,
+            probability_more_correct = (1 - same) / 2,
+        )
+
+    def test_chart_is_cached_until_new_score(self):
+        assert logic.get_summary_chart_data(self.user, 20) is None
+        for i in range(5):
+            self._add_score(0.1 * i)
+        data = logic.get_summary_chart_data(self.user, 20)
+        assert [float(x) for x in data["data"]["datasets"][1]["data"]] == [0, 0.1, 0.2, 0.3, 0.4]
+
+        with self.assertNumQueries(1):
+            assert logic.get_summary_chart_data(self.user, 20) == data
+
+        self._add_score(0.5)
+        assert len(logic.get_summary_chart_data(self.user, 20)["data"]["labels"]) == 6
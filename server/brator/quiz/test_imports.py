@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from . import imports, jobs
+from .models import Fact, ImportChunk, ImportJob, ImportState, Job
+from .testutils import create_superuser, DUMMY_FACT_DATA
+
+def _facts(n):
+    return [
+        {
+            "key": f"fact-{i}",
+            "numeric": {
+                "question_text": f"Question {i}?",
+                "correct_answer": i,
+                "correct_answer_unit": "none",
+            },
+        }
+        for i in range(n)
+    ]
+
+def _chunks(records, size):
+    return [records[i:i + size] for i in range(0, len(records), size)]
+
+@override_settings(JOBS_RUN_INLINE=False)
+class ImportJobTest(TestCase):
+    def setUp(self):
+        self.user = create_superuser()
+
+    def test_import_runs_in_batches(self):
+        job = imports.stage_fact_import(self.user, _chunks(_facts(25), 2))
+        assert ImportChunk.objects.count() == 13
+        assert not Fact.objects.exists()
+        assert imports.get_import_status(job.uid)["state"] == ImportState.PENDING
+
+        with mock.patch.object(imports, "CHUNKS_PER_RUN", 5):
+            assert jobs.run_pending_jobs() == 1
+            status = imports.get_import_status(job.uid)
+            assert status["state"] == ImportState.RUNNING
+            assert status["processed"] == 10
+            assert Job.objects.count() == 1
+            while jobs.run_pending_jobs():
+                pass
+
+        status = imports.get_import_status(job.uid)
+        assert status["state"] == ImportState.DONE
+        assert (status["total"], status["processed"], status["failed"], status["new"]) == (25, 25, 0, 25)
+        assert status["records_per_second"] > 0
+        assert Fact.objects.filter(active = True).count() == 25
+        assert not ImportChunk.objects.exists()
+
+    def test_failed_chunks_are_kept(self):
+        records = DUMMY_FACT_DATA[:2] + [{"key": "foo", "catfact": "miaow", "dogfact": "woof"}] + DUMMY_FACT_DATA[2:]
+        job = imports.stage_fact_import(self.user, _chunks(records, 2))
+        jobs.run_pending_jobs()
+        status = imports.get_import_status(job.uid)
+        assert status["state"] == ImportState.DONE
+        assert (status["processed"], status["failed"], status["new"]) == (4, 2, 2)
+        assert "BadRequest" in status["last_error"]
+        assert ImportChunk.objects.get().index == 1
+        assert list(Fact.objects.values_list("key", flat=True).order_by("key")) == ["human-legs", "isaac-18th"]
+
+    def test_staging_failure(self):
+        def chunks():
+            yield _facts(2)
+            raise ValueError("truncated upload")
+        with self.assertRaises(ValueError):
+            imports.stage_fact_import(self.user, chunks())
+        job = ImportJob.objects.get()
+        assert job.state == ImportState.FAILED
+        assert job.total == 2
+        assert not Job.objects.exists()
+
+@override_settings(JOBS_RUN_INLINE=True)
+class InlineImportTest(TransactionTestCase):
+    # The import view does not run in a transaction, so the inline job
+    # must start its own.
+    def test_async_import_inline(self):
+        self.client.force_login(create_superuser())
+        resp = self.client.post(reverse("quiz:api-facts-import") + "?async=1", content_type="application/json", data=_facts(5))
+        assert resp.status_code == 202
+        status = self.client.get(resp.json()["status_url"]).json()
+        assert (status["state"], status["processed"], status["new"]) == (ImportState.DONE, 5, 5)
+        assert Fact.objects.filter(active = True).count() == 5
@@ -0,0 +1,79 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import jobs, logic
+from .models import Job, JobState, SummaryScore
+from .testutils import answer_challenge, create_regular_user, create_numeric_fact
+
+failures = []
+
+@jobs.job_handler("test-flaky")
+def _flaky_handler(user, fail_times):
+    if len(failures) < fail_times:
+        failures.append(user)
+        raise RuntimeError("flaky")
+
+@override_settings(JOBS_RUN_INLINE=False)
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        failures.clear()
+
+    def _answer_n_times(self, n):
+        for i in range(n):
+            answer_challenge(self.user, 90, True)
+
+    def test_summaries_are_deferred_and_deduplicated(self):
+        create_numeric_fact()
+        self._answer_n_times(45)
+        assert not SummaryScore.objects.exists()
+        assert Job.objects.count() == 1
+        assert jobs.run_pending_jobs() == 1
+        assert not Job.objects.exists()
+        assert SummaryScore.objects.filter(batch_size = 20).count() == 2
+        assert logic.get_batch_progress(self.user, 20) == (5, 20)
+
+    def test_failed_jobs_are_retried(self):
+        jobs.enqueue("test-flaky", user=self.user, payload={"fail_times": 1})
+        assert jobs.run_pending_jobs() == 1
+        job = Job.objects.get()
+        assert job.state == JobState.PENDING
+        assert job.attempts == 1
+        assert "flaky" in job.last_error
+        assert jobs.run_pending_jobs() == 0
+        Job.objects.update(run_after = timezone.now())
+        assert jobs.run_pending_jobs() == 1
+        assert not Job.objects.exists()
+
+    def test_jobs_eventually_fail(self):
+        jobs.enqueue("test-flaky", user=self.user, payload={"fail_times": 100})
+        for i in range(jobs.MAX_ATTEMPTS):
+            Job.objects.update(run_after = timezone.now())
+            jobs.run_pending_jobs()
+        job = Job.objects.get()
+        assert job.state == JobState.FAILED
+        assert job.attempts == jobs.MAX_ATTEMPTS
+
+    def test_failed_retry_defers_to_newer_pending_job(self):
+        jobs.enqueue("test-flaky", user=self.user, payload={"fail_times": 1}, dedupe=True)
+        job, = jobs.claim_jobs(10)
+        jobs.enqueue("test-flaky", user=self.user, payload={"fail_times": 1}, dedupe=True)
+        jobs.run_job(job)
+        assert Job.objects.get().state == JobState.PENDING
+        assert Job.objects.get().attempts == 0
+
+    def test_run_jobs_command(self):
+        create_numeric_fact()
+        self._answer_n_times(20)
+        call_command("run_jobs", once=True, stdout=io.StringIO())
+        assert SummaryScore.objects.count() == 1
+
+@override_settings(JOBS_RUN_INLINE=True)
+class InlineJobsTest(TestCase):
+    def test_inline_mode_runs_immediately(self):
+        user = create_regular_user()
+        jobs.enqueue("test-flaky", user=user, payload={"fail_times": 0})
+        assert not Job.objects.exists()
@@ -1,32 +1,321 @@
+import datetime
+import io
+import pytest
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from . import logic
+from .exceptions import BadRequest
+from .models import Challenge, Fact, FactCategory, Response, SummaryProgress
+from .stats import calculate_plausibility_of
 
 from .testutils import (
+    answer_challenge,
+    create_custom_numeric_fact,
     create_regular_user,
     create_numeric_fact,
+    create_boolean_fact,
+    create_superuser,
+    DUMMY_FACT_DATA,
 )
 
+def _answer_n_times(user, n):
+    for i in range(n):
+        answer_challenge(user, 90, False)
+
 class LargestBatchSizeTest(TestCase):
     def test_get_largest_standard_summarized_batch_size(self):
         user = create_regular_user()
         fact = create_numeric_fact()
-        def _answer_n_times(n):
-            for i in range(n):
-                chal = logic.get_or_create_current_challenge(user)
-                logic.respond_to_challenge(user, chal.uid, {
-                    "numeric": {
-                        "confidence_percent": 90,
-                        "ci_low": 40,
-                        "ci_high": 60,
-                    },
-                })
         assert logic.get_largest_standard_summarized_batch_size(user) is None
-        _answer_n_times(19)
+        _answer_n_times(user, 19)
         assert logic.get_largest_standard_summarized_batch_size(user) is None
-        _answer_n_times(1)
+        _answer_n_times(user, 1)
         assert logic.get_largest_standard_summarized_batch_size(user) == 20
-        _answer_n_times(19)
+        _answer_n_times(user, 19)
         assert logic.get_largest_standard_summarized_batch_size(user) == 20
-        _answer_n_times(19)
+        _answer_n_times(user, 19)
         assert logic.get_largest_standard_summarized_batch_size(user) == 50
+
+class ActiveFactCountTest(TestCase):
+    def _count(self, name="legs-question"):
+        return FactCategory.objects.get(name = name).active_fact_count
+
+    def test_post_fact_counts(self):
+        logic.post_fact(DUMMY_FACT_DATA[0])
+        assert self._count() == 1
+        logic.post_fact(DUMMY_FACT_DATA[0])
+        assert self._count() == 1
+        logic.post_fact(DUMMY_FACT_DATA[2])
+        assert self._count() == 2
+        updated = dict(DUMMY_FACT_DATA[2], fine_print="Eight, usually.")
+        logic.post_fact(updated)
+        assert self._count() == 2
+        assert Fact.objects.filter(key = "spider-legs").count() == 2
+
+    def test_moving_fact_between_categories(self):
+        logic.post_fact(DUMMY_FACT_DATA[0])
+        moved = dict(DUMMY_FACT_DATA[0], category="scientist-question")
+        logic.post_fact(moved)
+        assert self._count() == 0
+        assert self._count("scientist-question") == 1
+
+    def test_admin_style_edits(self):
+        logic.post_fact(DUMMY_FACT_DATA[0])
+        fact = Fact.objects.get()
+        fact.active = False
+        fact.save()
+        assert self._count() == 0
+        fact.active = True
+        fact.save()
+        assert self._count() == 1
+        Fact.objects.get().delete()
+        assert self._count() == 0
+
+    def test_rebuild_fact_counts_command(self):
+        for x in DUMMY_FACT_DATA:
+            logic.post_fact(x)
+        FactCategory.objects.update(active_fact_count = 0)
+        call_command("rebuild_fact_counts", stdout=io.StringIO())
+        assert self._count() == 2
+        assert self._count("scientist-question") == 1
+
+class ChallengeQueueTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+
+    def _queued(self):
+        return Challenge.objects.filter(user = self.user, queued = True, active = True).count()
+
+    def test_queue_is_filled_in_bulk(self):
+        create_numeric_fact()
+        chal = logic.get_or_create_current_challenge(self.user)
+        assert not chal.queued
+        assert self._queued() == logic.CHALLENGE_QUEUE_SIZE - 1
+        assert logic.get_or_create_current_challenge(self.user).uid == chal.uid
+
+    def test_queue_is_topped_up_when_low(self):
+        create_numeric_fact()
+        seen = set()
+        for i in range(logic.CHALLENGE_QUEUE_SIZE):
+            chal = logic.get_or_create_current_challenge(self.user)
+            seen.add(chal.uid)
+            assert self._queued() >= logic.CHALLENGE_QUEUE_LOW_WATER
+            logic.discard_current_challenge(self.user)
+        assert len(seen) == logic.CHALLENGE_QUEUE_SIZE
+
+    def test_discard_only_affects_current_challenge(self):
+        create_numeric_fact()
+        logic.get_or_create_current_challenge(self.user)
+        queued = self._queued()
+        assert logic.discard_current_challenge(self.user) == 1
+        assert self._queued() == queued
+
+    def test_queued_challenges_for_retired_facts_are_skipped(self):
+        logic.post_fact(DUMMY_FACT_DATA[0])
+        logic.get_or_create_current_challenge(self.user)
+        logic.discard_current_challenge(self.user)
+        logic.post_fact(dict(DUMMY_FACT_DATA[0], fine_print="Usually."))
+        chal = logic.get_or_create_current_challenge(self.user)
+        assert chal.fact.active
+        assert chal.fact.fine_print == "Usually."
+
+    def test_cannot_respond_to_queued_challenge(self):
+        create_numeric_fact()
+        logic.get_or_create_current_challenge(self.user)
+        queued = Challenge.objects.filter(user = self.user, queued = True).first()
+        with pytest.raises(Challenge.DoesNotExist):
+            logic.respond_to_challenge(self.user, queued.uid, {
+                "numeric": {"confidence_percent": 90, "ci_low": 1, "ci_high": 3},
+            })
+
+class CreateChallengesTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+
+    def test_bulk_creation_is_constant_round_trips(self):
+        numeric = create_numeric_fact()
+        boolean = create_boolean_fact()
+        facts = [numeric, boolean] * 5
+        # Savepoint, one insert per challenge model, release.
+        with self.assertNumQueries(5):
+            challenges = logic.create_challenges_from_facts(self.user, facts)
+        assert [c.challenge_type for c in challenges] == [f.fact_type for f in facts]
+        assert all(c.challenge.fact_id for c in challenges)
+
+    def test_create_challenge_from_fact(self):
+        fact = create_boolean_fact()
+        challenge = logic.create_challenge_from_fact(self.user, fact)
+        challenge = Challenge.objects.get(pk = challenge.pk)
+        assert challenge.boolean_challenge.fact_id == fact.boolean_fact_id
+        assert challenge.numeric_challenge is None
+        assert not challenge.queued
+
+class PostFactsTest(TestCase):
+    def _numeric_facts(self, n, answer=1):
+        return [
+            {
+                "key": f"fact-{i}",
+                "category": f"category-{i % 3}",
+                "numeric": {
+                    "question_text": f"Question {i}?",
+                    "correct_answer": answer,
+                    "correct_answer_unit": "none",
+                },
+            }
+            for i in range(n)
+        ]
+
+    def test_same_result_as_post_fact(self):
+        assert logic.post_facts(DUMMY_FACT_DATA) == {"unchanged": 0, "new": 3, "updated": 0}
+        admin = create_superuser()
+        exported = logic.export_facts(admin)
+        hashes = set(Fact.objects.values_list("version_hash", flat=True))
+        counts = dict(FactCategory.objects.values_list("name", "active_fact_count"))
+
+        Fact.objects.all().delete()
+        FactCategory.objects.all().delete()
+        for x in DUMMY_FACT_DATA:
+            logic.post_fact(x)
+        assert logic.export_facts(admin) == exported
+        assert set(Fact.objects.values_list("version_hash", flat=True)) == hashes
+        assert dict(FactCategory.objects.values_list("name", "active_fact_count")) == counts
+
+    def test_counts_and_deactivation(self):
+        logic.post_facts(DUMMY_FACT_DATA[:2])
+        assert logic.select_random_fact() is not None
+        updated = dict(DUMMY_FACT_DATA[0], fine_print="Usually.")
+        rv = logic.post_facts([updated, DUMMY_FACT_DATA[1], DUMMY_FACT_DATA[2]])
+        assert rv == {"unchanged": 1, "new": 1, "updated": 1}
+        assert Fact.objects.count() == 4
+        assert Fact.objects.get(key = "human-legs", active = True).fine_print == "Usually."
+        assert FactCategory.objects.get(name = "legs-question").active_fact_count == 2
+        assert logic.post_facts(DUMMY_FACT_DATA[1:]) == {"unchanged": 2, "new": 0, "updated": 0}
+
+    def test_constant_round_trips(self):
+        logic.post_facts(self._numeric_facts(10))
+        query_counts = []
+        for n, existing in [(20, 10), (200, 20)]:
+            with CaptureQueriesContext(connection) as ctx:
+                rv = logic.post_facts(self._numeric_facts(n, answer=n))
+            assert rv == {"unchanged": 0, "new": n - existing, "updated": existing}
+            query_counts.append(len(ctx))
+        assert query_counts[0] == query_counts[1]
+        assert Fact.objects.filter(active = True).count() == 200
+
+    def test_invalid_category_name(self):
+        bad = dict(DUMMY_FACT_DATA[0], category="Bad Category!")
+        with pytest.raises(ValidationError):
+            logic.post_fact(bad)
+        with pytest.raises(ValidationError):
+            logic.post_facts([DUMMY_FACT_DATA[1], bad])
+        assert not FactCategory.objects.exists()
+        assert not Fact.objects.exists()
+
+    def test_bad_facts(self):
+        with pytest.raises(KeyError):
+            logic.post_facts([DUMMY_FACT_DATA[0], {"key": "foo", "catfact": "miaow"}])
+        with pytest.raises(BadRequest):
+            logic.post_facts([{"key": "foo", "catfact": "miaow", "dogfact": "woof"}])
+        assert not Fact.objects.exists()
+
+class SummaryProgressTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        create_numeric_fact()
+
+    def test_batch_progress(self):
+        _answer_n_times(self.user, 7)
+        assert logic.get_batch_progress(self.user, 20) == (7, 20)
+        _answer_n_times(self.user, 14)
+        assert logic.get_batch_progress(self.user, 20) == (1, 20)
+        assert logic.get_batch_progress(self.user, 50) == (21, 50)
+        with self.assertNumQueries(1):
+            logic.get_batch_progress(self.user, 20)
+
+    def test_progress_is_initialized_from_existing_summaries(self):
+        _answer_n_times(self.user, 23)
+        summary = logic.get_last_summary(self.user, 20)
+        SummaryProgress.objects.all().delete()
+        assert logic.get_batch_progress(self.user, 20) == (3, 20)
+        assert logic.get_batch_progress(self.user, 50) == (23, 50)
+        _answer_n_times(self.user, 17)
+        new_summary = logic.get_last_summary(self.user, 20)
+        assert new_summary.pk != summary.pk
+        assert not set(summary.datapoints.all()) & set(new_summary.datapoints.all())
+
+class EvalStatsTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        create_numeric_fact()
+        for i in range(60):
+            answer_challenge(self.user, [50, 70, 90][i % 3], i % 4 != 0)
+        old = timezone.now() - datetime.timedelta(days=2)
+        Response.objects.filter(pk__in = Response.objects.order_by("pk").values("pk")[:25]).update(creation_time = old)
+
+    def _expected(self, objs):
+        return {
+            "number_of_answers": len(objs),
+            "number_of_correct_answers": sum(o.correct for o in objs),
+            "expected_correct_answers": sum(o.confidence_percent / 100 for o in objs),
+            "plausibility": calculate_plausibility_of([(o.confidence_percent / 100, o.correct) for o in objs]),
+        }
+
+    def test_eval_stats(self):
+        with self.assertNumQueries(3):
+            stats = logic.get_eval_stats(self.user)["stats"]
+        objs = list(Response.objects.filter(user = self.user).order_by("-creation_time", "-pk"))
+        total = stats["total"]
+        expected = self._expected(objs)
+        assert total["plausibility"].pop("method") == "poisson-binomial-incremental"
+        expected["plausibility"].pop("method")
+        assert total.pop("plausibility") == pytest.approx(expected.pop("plausibility"), abs=1e-12)
+        assert total == expected
+        assert stats["24h"] == self._expected(objs[:35])
+        assert stats["last50"] == self._expected(objs[:50])
+        assert stats["last10"] == self._expected(objs[:10])
+        assert stats["24h"]["number_of_correct_answers"] not in (0, 35)
+        assert stats["7d"]["number_of_answers"] == 60
+
+    def test_eval_stats_without_responses(self):
+        stats = logic.get_eval_stats(create_regular_user("other"))["stats"]
+        assert stats["total"]["number_of_answers"] == 0
+        assert stats["last10"]["plausibility"] is None
+
+class CategoryEvalStatsTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        for x in DUMMY_FACT_DATA:
+            logic.post_fact(x)
+        create_custom_numeric_fact("How many roads must a man walk down?", 2)
+        for i in range(40):
+            answer_challenge(self.user, [55, 70, 90][i % 3], i % 4 != 0)
+
+    def test_category_eval_stats(self):
+        with self.assertNumQueries(1):
+            rv = logic.get_category_eval_stats(self.user)
+
+        responses = list(Response.objects.filter(user = self.user).select_related("challenge__fact__category"))
+        by_category = {}
+        for r in responses:
+            category = r.challenge.fact.category
+            by_category.setdefault(category.name if category else None, []).append(r)
+        assert [x["category"] for x in rv] == sorted(by_category, key=lambda name: (name is None, name))
+
+        for stats in rv:
+            objs = by_category[stats["category"]]
+            assert stats["number_of_answers"] == len(objs)
+            assert stats["number_of_correct_answers"] == sum(o.correct for o in objs)
+            assert stats["expected_correct_answers"] == sum(o.confidence_percent for o in objs) / 100
+            brier = sum((float(o.confidence_percent) / 100 - o.correct) ** 2 for o in objs) / len(objs)
+            assert stats["brier_score"] == pytest.approx(brier)
+            expected = calculate_plausibility_of([(o.confidence_percent / 100, o.correct) for o in objs])
+            if expected is None:
+                assert stats["plausibility"] is None
+            else:
+                assert stats["plausibility"]["prob_same"] == pytest.approx(expected["prob_same"], abs=1e-12)
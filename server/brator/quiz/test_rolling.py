@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from . import logic, rolling
+from .models import Response, RollingScore, RollingWindow
+from .stats import calculate_plausibility_of
+from .testutils import answer_challenge, create_regular_user, create_numeric_fact
+
+class RollingWindowTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        create_numeric_fact()
+
+    def _answer(self, i):
+        answer_challenge(self.user, [55, 70, 90, 99][i % 4], i % 3 != 0)
+
+    def _check_scores(self, window_size):
+        responses = list(Response.objects.filter(user = self.user).order_by("pk"))
+        scores = list(RollingScore.objects.filter(window_size = window_size).order_by("response"))
+        assert len(scores) == len(responses) - window_size + 1
+        for end, score in enumerate(scores, window_size):
+            window = responses[end - window_size:end]
+            assert score.response_id == window[-1].pk
+            assert score.actual_correct == sum(r.correct for r in window)
+            assert score.expected_correct == sum(r.confidence_percent for r in window) / 100
+            expected = calculate_plausibility_of([(r.confidence_percent / 100, r.correct) for r in window])
+            assert abs(float(score.probability_fewer_correct) - expected["prob_fewer"]) < 1e-8
+            assert abs(float(score.probability_same_correct) - expected["prob_same"]) < 1e-8
+
+    def test_window_slides_one_response_at_a_time(self):
+        for i in range(17):
+            self._answer(i)
+            if i % 4 == 1:
+                rolling.update_rolling_window(self.user, 6)
+        rolling.update_rolling_window(self.user, 6)
+        self._check_scores(6)
+        window = RollingWindow.objects.get(window_size = 6)
+        assert window.answers == 6
+        assert 0 < window.updates_since_recompute < 6
+
+    def test_bad_state_is_recomputed(self):
+        for i in range(8):
+            self._answer(i)
+        rolling.update_rolling_window(self.user, 6)
+        RollingWindow.objects.filter(window_size = 6).update(pmf = b"", answers = 2)
+        for i in range(3):
+            self._answer(i)
+        assert rolling.update_rolling_window(self.user, 6) == 3
+        self._check_scores(6)
+
+    def test_summary_job_updates_windows(self):
+        for i in range(logic.ROLLING_WINDOW_SIZES[0] + 1):
+            self._answer(i)
+        assert RollingScore.objects.filter(window_size = logic.ROLLING_WINDOW_SIZES[0]).count() == 2
+        assert logic.get_rolling_chart_data(self.user)["data"]["labels"]
+
+    def test_chart_reads_only_the_latest_scores(self):
+        for i in range(10):
+            self._answer(i)
+        rolling.update_rolling_window(self.user, 6)
+        latest = RollingScore.objects.filter(window_size = 6).order_by("-response")[:3]
+        with mock.patch.object(logic, "ROLLING_CHART_ROWS", 3):
+            chart = logic.get_rolling_chart_data(self.user, 6)
+        same = chart["data"]["datasets"][1]["data"]
+        assert same == [score.probability_same_correct for score in reversed(latest)]
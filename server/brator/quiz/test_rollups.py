@@ -0,0 +1,71 @@
+import datetime
+import io
+
+import pytest
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from . import logic, rollups
+from .models import Response, ResponseRollup
+from .testutils import answer_challenge, create_regular_user, create_numeric_fact
+
+class RollupTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        create_numeric_fact()
+
+    def _answer_some(self):
+        # Spreads the responses over a few days by backdating them.
+        now = timezone.now()
+        for i in range(12):
+            response = answer_challenge(self.user, [60, 90, 90][i % 3], i % 5 != 0)
+            Response.objects.filter(pk = response.pk).update(creation_time = now - datetime.timedelta(days=3 * (i % 4)))
+        rollups.rebuild()
+
+    def test_rollups_follow_responses(self):
+        for i in range(5):
+            answer_challenge(self.user, 70, i != 0)
+        row = ResponseRollup.objects.get(user = self.user)
+        assert row.period_start == rollups.period_start(timezone.now())
+        assert (row.answers, row.correct_answers, row.confidence_percent_sum) == (5, 4, 350)
+        assert rollups.check() == []
+
+    def test_window_stats(self):
+        self._answer_some()
+        responses = list(Response.objects.filter(user = self.user))
+        with self.assertNumQueries(1):
+            windows = rollups.get_window_stats(self.user, [1, 7, 30])
+        for days, stats in windows.items():
+            cutoff = rollups.period_start(timezone.now() - datetime.timedelta(days=days))
+            inside = [r for r in responses if r.creation_time >= cutoff]
+            assert stats["number_of_answers"] == len(inside)
+            assert stats["number_of_correct_answers"] == sum(r.correct for r in inside)
+            assert stats["expected_correct_answers"] == sum(r.confidence_percent for r in inside) / 100
+
+        eval_stats = logic.get_eval_stats(self.user)["stats"]
+        assert eval_stats["7d"]["number_of_answers"] == 9
+        assert eval_stats["30d"]["number_of_answers"] == 12
+
+    def test_daily_trend(self):
+        self._answer_some()
+        trend = rollups.get_daily_trend(self.user, 30)
+        assert [n for _, n, _, _ in trend] == [3, 3, 3, 3]
+        assert [day for day, _, _, _ in trend] == sorted(day for day, _, _, _ in trend)
+        chart = logic.get_trend_chart_data(self.user)
+        assert len(chart["data"]["labels"]) == 4
+        assert logic.get_trend_chart_data(create_regular_user("other")) is None
+
+    def test_check_and_rebuild(self):
+        self._answer_some()
+        ResponseRollup.objects.filter(user = self.user).first().delete()
+        assert [user_id for user_id, _ in rollups.check()] == [self.user.pk]
+
+        with pytest.raises(CommandError):
+            call_command("check_rollups", stdout=io.StringIO())
+
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("check_rollups", stdout=out)
+        assert "consistent" in out.getvalue()
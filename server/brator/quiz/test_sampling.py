@@ -0,0 +1,59 @@
+import random
+
+from django.test import TestCase
+
+from . import sampling
+from .logic import post_fact, post_fact_category, select_random_fact, select_random_facts
+from .seenset import FactBitmap
+from .models import Fact
+from .testutils import DUMMY_FACT_DATA
+
+def test_alias_table_distribution():
+    table = sampling.AliasTable([1, 3, 0, 4])
+    rng = random.Random(1234)
+    counts = [0] * len(table)
+    n = 80000
+    for _ in range(n):
+        counts[table.sample(rng)] += 1
+    assert counts[2] == 0
+    for i, expected in enumerate([1/8, 3/8, 0, 4/8]):
+        assert abs(counts[i] / n - expected) < 0.01
+
+def test_alias_table_zero_weights():
+    table = sampling.AliasTable([0, 0])
+    rng = random.Random(1234)
+    assert {table.sample(rng) for _ in range(100)} == {0, 1}
+
+class SamplingIndexTest(TestCase):
+    def test_index_follows_post_fact(self):
+        assert select_random_fact() is None
+        post_fact(DUMMY_FACT_DATA[1])
+        assert select_random_fact().key == "isaac-18th"
+
+    def test_index_respects_category_weights(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        post_fact_category({"name": "legs-question", "weight": 0})
+        post_fact_category({"name": "scientist-question", "weight": 1})
+        keys = {select_random_fact().key for _ in range(20)}
+        assert keys == {"isaac-18th"}
+
+    def test_stale_index_is_rebuilt(self):
+        post_fact(DUMMY_FACT_DATA[0])
+        assert select_random_fact().key == "human-legs"
+        Fact.objects.update(active = False)
+        assert select_random_fact() is None
+
+    def test_uncategorized_facts(self):
+        post_fact({k: v for k, v in DUMMY_FACT_DATA[0].items() if k != "category"})
+        index = sampling.get_index(force_rebuild = True)
+        assert not index.categories
+        assert select_random_fact().key == "human-legs"
+
+    def test_exclude_is_not_modified(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        exclude = FactBitmap()
+        facts = select_random_facts(2, exclude=exclude)
+        assert len({fact.pk for fact in facts}) == 2
+        assert len(exclude) == 0
@@ -0,0 +1,87 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from . import logic, sampling, seenset
+from .models import Challenge, Fact
+from .testutils import answer_challenge, create_regular_user, DUMMY_FACT_DATA
+
+def test_fact_bitmap():
+    bitmap = seenset.FactBitmap()
+    assert 5 not in bitmap
+    bitmap.add(5)
+    bitmap.add(1000)
+    assert 5 in bitmap
+    assert 1000 in bitmap
+    assert 6 not in bitmap
+    assert 100000 not in bitmap
+    assert len(bitmap) == 2
+    restored = seenset.FactBitmap(bitmap.to_bytes())
+    assert 1000 in restored
+    assert len(restored) == 2
+
+def test_sample_with_exclusions():
+    index = sampling.FactSamplingIndex(
+        ((1, "a", 1, 3), (2, "b", 1, 2)),
+        {1: [10, 11, 12], 2: [20, 21]},
+    )
+    rng = random.Random(1234)
+    exclude = seenset.FactBitmap()
+    drawn = []
+    for _ in range(5):
+        fact_id = index.sample(rng, exclude=exclude)
+        exclude.add(fact_id)
+        drawn.append(fact_id)
+    assert sorted(drawn) == [10, 11, 12, 20, 21]
+    assert index.sample(rng, exclude=exclude) is None
+
+def test_sampler_scans_once():
+    fact_ids = {1: list(range(1, 1001)), 2: list(range(1001, 1101))}
+    index = sampling.FactSamplingIndex(((1, "a", 1, 1000), (2, "b", 1, 100)), fact_ids)
+    exclude = seenset.FactBitmap()
+    for x in range(1, 1101):
+        if x % 100 != 7:
+            exclude.add(x)
+    sampler = index.sampler(random.Random(1234), exclude)
+    scans = []
+    build = sampler._build_unseen
+    sampler._build_unseen = lambda: scans.append(1) or build()
+    drawn = [sampler.sample() for _ in range(11)]
+    assert sorted(drawn) == list(range(7, 1101, 100))
+    assert sampler.sample() is None
+    assert scans == [1]
+    assert all(x in exclude for x in drawn)
+
+class NoRepeatTest(TestCase):
+    def setUp(self):
+        self.user = create_regular_user()
+        for x in DUMMY_FACT_DATA:
+            logic.post_fact(x)
+
+    def _answer(self):
+        return answer_challenge(self.user, 90, True).challenge.fact.key
+
+    @override_settings(NO_REPEAT_FACTS=True)
+    def test_no_repeats_until_exhausted(self):
+        keys = [self._answer() for _ in range(len(DUMMY_FACT_DATA))]
+        assert len(set(keys)) == len(DUMMY_FACT_DATA)
+        seen = seenset.load_seen_facts(self.user)
+        assert len(seen) == len(DUMMY_FACT_DATA)
+        for fact in Fact.objects.all():
+            assert fact.pk in seen
+        self._answer()
+
+    @override_settings(NO_REPEAT_FACTS=True)
+    def test_seen_set_survives_cache_loss(self):
+        self._answer()
+        seenset._cache.clear()
+        assert len(seenset.load_seen_facts(self.user)) == 1
+
+    @override_settings(NO_REPEAT_FACTS=True)
+    def test_fill_excludes_pending_challenges(self):
+        current = logic.get_or_create_current_challenge(self.user)
+        Challenge.objects.filter(user = self.user, queued = True).update(active = False)
+        created = [c.fact_id for c in logic.fill_challenge_queue(self.user)]
+        # The two other facts come first; only then are repeats allowed.
+        assert current.fact_id not in created[:2]
+        assert len(set(created[:2])) == 2
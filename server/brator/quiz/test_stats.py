@@ -1,6 +1,28 @@
 import decimal
+import io
+import math
+import random
 
-from .stats import poisson_binomial_dft_pmf
+import numpy as np
+import pytest
+
+from django.core.management import call_command
+
+from .stats import (
+    calculate_plausibility_from_histogram,
+    calculate_plausibility_of,
+    poisson_binomial_dft_pmf,
+    poisson_binomial_pmf,
+    poisson_binomial_pmf_grouped,
+    poisson_binomial_pmf_product_tree,
+    add_to_pmf,
+    calculate_plausibilities_from_histograms,
+    poisson_binomial_pmfs_batched,
+    divide_pmf,
+    multiply_pmf,
+    plausibility_from_pmf,
+    trim_pmf,
+)
 
 def test_poisson_binomial_df_pmf():
     xs = [0.5, 0.5, 0.5]
@@ -18,3 +40,154 @@ def test_poisson_binomial_df_pmf_decimals():
     assert (poisson_binomial_dft_pmf(xs, 2) - 0.375) < epsilon
     assert (poisson_binomial_dft_pmf(xs, 3) - 0.125) < epsilon
 
+
+def test_poisson_binomial_pmf_matches_reference():
+    rng = random.Random(1234)
+    for n in [1, 2, 3, 10, 37]:
+        ps = [rng.uniform(0.01, 0.99) for _ in range(n)]
+        pmf = poisson_binomial_pmf(ps)
+        assert len(pmf) == n + 1
+        assert abs(sum(pmf) - 1) < 1e-9
+        for k in range(n + 1):
+            assert abs(pmf[k] - poisson_binomial_dft_pmf(ps, k)) < 1e-12
+
+def test_poisson_binomial_pmf_large():
+    ps = [0.5] * 600
+    pmf = poisson_binomial_pmf(ps)
+    assert abs(pmf[300] - math.comb(600, 300) / 2 ** 600) < 1e-12
+
+def test_calculate_plausibility_of():
+    data = [(0.9, True)] * 9 + [(0.9, False)]
+    rv = calculate_plausibility_of(data)
+    same = 10 * 0.9 ** 9 * 0.1
+    more = 0.9 ** 10
+    assert abs(rv["prob_same"] - same) < 1e-9
+    assert abs(rv["prob_more"] - more) < 1e-9
+    assert abs(rv["prob_fewer"] - (1 - same - more)) < 1e-9
+
+def test_product_tree_matches_fft():
+    rng = random.Random(1234)
+    for n in [1, 2, 3, 31, 32, 33, 100, 1500]:
+        ps = [rng.uniform(0.01, 0.99) for _ in range(n)]
+        tree = poisson_binomial_pmf_product_tree(ps)
+        assert len(tree) == n + 1
+        assert abs(tree - poisson_binomial_pmf(ps)).max() < 1e-12
+
+def test_product_tree_large():
+    pmf = poisson_binomial_pmf_product_tree([0.5] * 5000)
+    assert abs(pmf[2500] - math.comb(5000, 2500) / 2 ** 5000) < 1e-12
+
+def test_calculate_plausibility_of_large():
+    data = [(0.8, True)] * 4000 + [(0.8, False)] * 1000
+    rv = calculate_plausibility_of(data)
+    assert rv["method"] == "poisson-binomial-grouped"
+    same = math.exp(
+        math.lgamma(5001) - math.lgamma(4001) - math.lgamma(1001)
+        + 4000 * math.log(0.8) + 1000 * math.log(0.2)
+    )
+    assert abs(rv["prob_same"] - same) < 1e-12
+    assert abs(rv["prob_fewer"] + rv["prob_same"] + rv["prob_more"] - 1) < 1e-9
+
+def test_calculate_plausibility_of_distinct_confidences():
+    rng = random.Random(1234)
+    data = [(rng.uniform(0.5, 0.99), rng.random() < 0.75) for _ in range(1000)]
+    rv = calculate_plausibility_of(data)
+    assert rv["method"] == "poisson-binomial-product-tree"
+    assert abs(rv["prob_fewer"] + rv["prob_same"] + rv["prob_more"] - 1) < 1e-9
+
+def test_grouped_matches_product_tree():
+    rng = random.Random(1234)
+    for n, distinct in [(1, 1), (10, 1), (50, 3), (500, 7), (3000, 20)]:
+        values = [rng.uniform(0.01, 0.99) for _ in range(distinct)]
+        ps = [values[i % distinct] for i in range(n)]
+        histogram = [(p, ps.count(p)) for p in values]
+        grouped = poisson_binomial_pmf_grouped(histogram)
+        assert len(grouped) == n + 1
+        assert abs(grouped - poisson_binomial_pmf_product_tree(ps)).max() < 1e-12
+
+def test_grouped_pmf_is_cached():
+    a = poisson_binomial_pmf_grouped([(0.9, 7), (0.6, 3), (0.9, 2)])
+    b = poisson_binomial_pmf_grouped([(0.6, 3), (0.9, 9)])
+    assert a is b
+    assert not a.flags.writeable
+
+def test_calculate_plausibility_from_histogram():
+    data = [(0.9, True)] * 9 + [(0.9, False)] + [(0.6, True)] * 3 + [(0.6, False)] * 2
+    rv = calculate_plausibility_from_histogram([(0.9, 10), (0.6, 5)], 12)
+    assert rv == calculate_plausibility_of(data)
+    assert calculate_plausibility_from_histogram([(0.9, 4)], 2) is None
+    with pytest.raises(ValueError):
+        calculate_plausibility_from_histogram([(0.9, 10)], 11)
+
+def test_calculate_plausibility_of_approximation():
+    rng = random.Random(1234)
+    data = [(rng.choice([0.6, 0.75, 0.9]), rng.random() < 0.76) for _ in range(3000)]
+    exact = calculate_plausibility_of(data)
+    approx = calculate_plausibility_of(data, max_exact = 1000)
+    assert approx["method"] == "refined-normal-approximation"
+    assert 0 < approx["error_bound"] < 0.05
+    for key in ["prob_fewer", "prob_same", "prob_more"]:
+        assert abs(approx[key] - exact[key]) < approx["error_bound"]
+
+def test_incremental_pmf():
+    rng = random.Random(1234)
+    ps = [rng.choice([0.5, 0.7, 0.9, 0.99]) for _ in range(2000)]
+    pmf, offset = np.ones(1), 0
+    for p in ps:
+        pmf, offset = add_to_pmf(pmf, offset, p)
+    assert len(pmf) < 400
+    exact = poisson_binomial_pmf_grouped([(p, ps.count(p)) for p in set(ps)])
+    assert abs(pmf - exact[offset:offset + len(pmf)]).max() < 1e-12
+    assert exact[:offset].sum() < 1e-12
+
+    k = int(sum(ps))
+    rv = plausibility_from_pmf(pmf, offset, k)
+    assert rv["prob_same"] == pytest.approx(exact[k], abs=1e-12)
+    assert rv["prob_fewer"] == pytest.approx(exact[:k].sum(), abs=1e-12)
+    assert plausibility_from_pmf(pmf, offset, 0)["prob_more"] == pytest.approx(1)
+
+def test_divide_pmf():
+    ps = [0.9, 0.3, 0.5, 0.999, 0.05]
+    pmf = np.ones(1)
+    for p in ps:
+        pmf = multiply_pmf(pmf, p)
+    for i, p in enumerate(ps):
+        rest = ps[:i] + ps[i + 1:]
+        assert abs(divide_pmf(pmf, p) - poisson_binomial_pmf(rest)).max() < 1e-14
+
+def test_trim_pmf():
+    pmf, offset = trim_pmf(np.array([1e-20, 1e-3, 0.998, 1e-3, 1e-17]), 5)
+    assert list(pmf) == [1e-3, 0.998, 1e-3]
+    assert offset == 6
+
+def test_batched_pmfs():
+    rng = random.Random(1234)
+    values = [0.5, 0.6, 0.75, 0.9, 0.99]
+    histograms = [[(p, rng.randint(0, 60)) for p in rng.sample(values, 3)] for _ in range(20)]
+    histograms += [[(0.9, 1)], [], [(0.999, 700), (0.5, 300)]]
+    for pmf, histogram in zip(poisson_binomial_pmfs_batched(histograms), histograms):
+        assert len(pmf) == sum(count for _, count in histogram) + 1
+        assert abs(pmf - poisson_binomial_pmf_grouped(histogram)).max() < 1e-12
+
+def test_calculate_plausibilities_from_histograms():
+    groups = [
+        ([(0.9, 10), (0.6, 5)], 12),
+        ([(0.9, 3)], 3),
+        ([(0.75, 3000), (0.6, 20)], 2260),
+        ([(0.55, 7)], 0),
+    ]
+    rv = calculate_plausibilities_from_histograms(groups)
+    assert rv[1] is None
+    assert rv[0]["method"] == "poisson-binomial-batched"
+    assert rv[2]["method"] == "poisson-binomial-grouped"
+    for result, (histogram, num_correct) in zip(rv, groups):
+        expected = calculate_plausibility_from_histogram(histogram, num_correct)
+        if expected is None:
+            continue
+        for key in ["prob_fewer", "prob_same", "prob_more"]:
+            assert result[key] == pytest.approx(expected[key], abs=1e-12)
+
+def test_benchmark_stats_command():
+    out = io.StringIO()
+    call_command("benchmark_stats", "5", "60", repeat=1, stdout=out)
+    assert "n=   60" in out.getvalue()
@@ -1,6 +1,8 @@
 import secrets
 
 from django.contrib.auth.models import User
+
+from . import logic
 from .models import Fact, NumericFact, BooleanFact
 
 DUMMY_NUMERIC_FACT = {
@@ -83,3 +85,19 @@ def create_boolean_fact():
 
 def create_fact():
     create_numeric_fact()
+
+def answer_challenge(user, confidence_percent, correct):
+    # Answers the user's current challenge, rightly or wrongly as asked,
+    # whatever its type. Returns the Response.
+    chal = logic.get_or_create_current_challenge(user)
+    if chal.challenge_type == "boolean":
+        answer = chal.fact.boolean_fact.correct_answer
+        response = {"answer": answer if correct else not answer}
+    else:
+        answer = chal.fact.numeric_fact.correct_answer
+        if correct:
+            response = {"ci_low": answer - 1, "ci_high": answer + 1}
+        else:
+            response = {"ci_low": answer + 1000, "ci_high": answer + 2000}
+    response["confidence_percent"] = confidence_percent
+    return logic.respond_to_challenge(user, chal.uid, {chal.challenge_type: response})
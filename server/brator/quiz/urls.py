@@ -11,6 +11,8 @@ app_name = "quiz"
 urlpatterns = [
     path("api/facts/export/", api.export_facts_view, name="api-facts-export"),
     path("api/facts/import/", api.import_facts_view, name="api-facts-import"),
+    path("api/facts/manifest/", api.fact_manifest_view, name="api-facts-manifest"),
+    path("api/imports/<str:uid>/", api.import_status_view, name="api-import-status"),
     path("api/categories/export/", api.export_fact_categories_view, name="api-categories-export"),
     path("api/categories/import/", api.import_fact_categories_view, name="api-categories-import"),
     path("api/", include(router.urls), name="api"),
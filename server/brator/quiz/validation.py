@@ -0,0 +1,90 @@
+from typing import Any, NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+class TaggedUnion(NamedTuple):
+    choiceclass: Any
+    tag_field: str
+    suffix: str
+
+class ModelValidator:
+    def __init__(self, model):
+        self.model = model
+        self.needs_clean = model.clean is not models.Model.clean
+
+        self.tagged_union = getattr(model, "tagged_union", None)
+        self.valid_tags = ()
+        self.attnames = ()
+        if self.tagged_union:
+            self.valid_tags = tuple(x[0] for x in self.tagged_union.choiceclass.choices)
+            self.attnames = tuple(
+                field.attname
+                for field in model._meta.concrete_fields
+                if field.is_relation and field.name.endswith(self.tagged_union.suffix)
+            )
+
+_registry = {}
+
+def build_registry(all_models):
+    for model in all_models:
+        _registry[model] = ModelValidator(model)
+
+def get_validator(model):
+    validator = _registry.get(model)
+    if validator is None:
+        validator = _registry[model] = ModelValidator(model)
+    return validator
+
+def validate(instance):
+    if get_validator(instance.__class__).needs_clean:
+        instance.clean()
+
+def validate_all(instances):
+    # Bulk inserts skip the pre_save validation hook, so objects about to be
+    # bulk_created are validated with this instead.
+    for instance in instances:
+        validate(instance)
+
+def validate_tagged_union(obj):
+    # Only reads the *_id columns, so this never hits the database.
+    validator = get_validator(obj.__class__)
+    class_name = obj.__class__.__name__
+    tag_field = validator.tagged_union.tag_field
+
+    tag = getattr(obj, tag_field)
+
+    if tag not in validator.valid_tags:
+        raise ValidationError(f"{class_name}: {tag_field} has illegal value {tag}; legal values: {' '.join(validator.valid_tags)}")
+
+    expected_field = tag + validator.tagged_union.suffix
+
+    if getattr(obj, expected_field + "_id", None) is None:
+        raise ValidationError(f"{class_name}: {tag_field} is {tag}; {expected_field} must be set")
+
+    set_field_names = [name[:-len("_id")] for name in validator.attnames if getattr(obj, name) is not None]
+
+    if len(set_field_names) > 1:
+        raise ValidationError(f"{class_name}: multiple tagged union fields set: {' '.join(set_field_names)}")
+
+def validate_tagged_union_by_reflection(obj, choiceclass, tag_field, suffix):
+    # The original implementation, kept as a baseline for the validation
+    # benchmark.
+    class_name = obj.__class__.__name__
+
+    tag = getattr(obj, tag_field)
+
+    valid = [x[0] for x in choiceclass.choices]
+    if tag not in valid:
+        raise ValidationError(f"{class_name}: {tag_field} has illegal value {tag}; legal values: {' '.join(valid)}")
+
+    expected_field = tag + suffix
+
+    if not getattr(obj, expected_field, None):
+        raise ValidationError(f"{class_name}: {tag_field} is {tag}; {expected_field} must be set")
+
+    field_names = [name for name in dir(obj) if name.endswith(suffix)]
+    set_field_names = [name for name in field_names if getattr(obj, name, None)]
+
+    if len(set_field_names) > 1:
+        raise ValidationError(f"{class_name}: multiple tagged union fields set: {' '.join(set_field_names)}")
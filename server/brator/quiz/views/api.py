@@ -1,17 +1,25 @@
 import json
 import functools
 import base64
+import gzip
+import io
+import itertools
 import logging
+import tempfile
 
 from django.shortcuts import render
-from django.http import HttpRequest, HttpResponse
+from django.http import FileResponse, HttpRequest, HttpResponse
+from django.urls import reverse
 from django.contrib.auth import authenticate, login
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.exceptions import APIException
 
+from .. import imports
+from ..exceptions import BadRequest
 from ..models import Fact
 from ..serializers import FactFullSerializer, ChallengeSerializer, ScoreSerializer
 
@@ -19,8 +27,13 @@ from ..logic import get_or_create_current_challenge
 from ..logic import discard_current_challenge
 from ..logic import respond_to_challenge
 from ..logic import get_user_responses
+from ..logic import get_eval_stats
+from ..logic import get_category_eval_stats
+from ..calibration import get_calibration_curve
 from ..logic import post_fact
-from ..logic import export_facts
+from ..logic import post_facts
+from ..logic import sync_fact_manifest
+from ..logic import iter_export_facts
 from ..logic import export_fact_categories
 from ..logic import post_fact_category
 
@@ -61,6 +74,18 @@ class EvalViewSet(viewsets.GenericViewSet):
         responses = get_user_responses(user, limit=1000)
         return Response(ScoreSerializer(responses, many=True).data)
 
+    @action(detail=False, methods=["GET"], url_name="stats")
+    def stats(self, request):
+        return Response(get_eval_stats(self.request.user)["stats"])
+
+    @action(detail=False, methods=["GET"], url_name="categories")
+    def categories(self, request):
+        return Response(get_category_eval_stats(self.request.user))
+
+    @action(detail=False, methods=["GET"], url_path="calibration-curve", url_name="calibration-curve")
+    def calibration_curve(self, request):
+        return Response(get_calibration_curve(self.request.user))
+
 class FactViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAdminUser]
 
@@ -103,35 +128,151 @@ def api_view(f):
             )
     return wrapped
 
+NDJSON_CONTENT_TYPES = ["application/x-ndjson", "application/jsonl"]
+
+# Exports are spooled to a temporary file, in memory up to this size.
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
+def _json_array_stream(records):
+    yield "["
+    for i, x in enumerate(records):
+        yield ("\n" if i == 0 else ",\n") + json.dumps(x)
+    yield "\n]\n"
+
+def _ndjson_stream(records):
+    for x in records:
+        yield json.dumps(x) + "\n"
+
+def _accepts_gzip(request):
+    # Whether Accept-Encoding allows gzip, honouring q=0 and "*".
+    qualities = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = [x.strip() for x in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.lower()] = q
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+def _wants_ndjson(request):
+    if request.GET.get("format") == "ndjson":
+        return True
+    return any(x in request.headers.get("Accept", "") for x in NDJSON_CONTENT_TYPES)
+
 @api_view
 def export_facts_view(request):
-    data = export_facts(request.user)
-    serialized = json.dumps(data, indent="  ")
-    return HttpResponse(
-        serialized,
-        content_type = "application/json",
-    )
+    # The facts are read in chunks from a server-side cursor and written to
+    # a spooled temporary file, so memory use does not grow with the number
+    # of facts. This happens here rather than while the response is sent:
+    # under ASGI the body is consumed in the event loop, where the database
+    # cannot be used.
+    # A JSON array by default; NDJSON with ?format=ndjson or an NDJSON
+    # Accept header; gzipped if the client accepts that.
+    facts = iter_export_facts(request.user)
+
+    if _wants_ndjson(request):
+        content, content_type = _ndjson_stream(facts), NDJSON_CONTENT_TYPES[0]
+    else:
+        content, content_type = _json_array_stream(facts), "application/json"
+
+    gzipped = _accepts_gzip(request)
+    spool = tempfile.SpooledTemporaryFile(max_size = EXPORT_SPOOL_SIZE)
+    out = gzip.GzipFile(fileobj = spool, mode = "wb") if gzipped else spool
+    writer = io.TextIOWrapper(out, encoding = "utf-8")
+    for chunk in content:
+        writer.write(chunk)
+    writer.flush()
+    writer.detach()
+    if gzipped:
+        out.close()
+    spool.seek(0)
+
+    response = FileResponse(spool, content_type = content_type)
+    response["Vary"] = "Accept, Accept-Encoding"
+    if gzipped:
+        response["Content-Encoding"] = "gzip"
+    return response
+
+# Imports are written, each in its own transaction, in chunks of this many
+# records.
+IMPORT_CHUNK_SIZE = 1000
+
+def _iter_import_records(request):
+    # Yields the records of an import body: a JSON object or array, or, with
+    # an NDJSON content type, one JSON object per line. NDJSON bodies are
+    # read incrementally, so they need not fit in memory; both may be sent
+    # gzipped.
+    encoding = request.headers.get("Content-Encoding", "identity")
+    if encoding == "gzip":
+        stream = gzip.GzipFile(fileobj=request, mode="rb")
+    elif encoding == "identity":
+        stream = request
+    else:
+        raise BadRequest(f"Unsupported Content-Encoding: {encoding}")
+
+    if request.content_type not in NDJSON_CONTENT_TYPES:
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = [data]
+        yield from data
+        return
+
+    for i, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise BadRequest(f"Invalid JSON on line {i}: {e}")
+
+def _chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
 
 @api_view
 @csrf_exempt
+@transaction.non_atomic_requests
 def import_facts_view(request):
     if not request.user.is_staff:
-        return HttpResponse("Permission denied", status_code=403)
+        return HttpResponse("Permission denied", status=403)
 
     if not request.method == "POST":
-        return HttpResponse("Wrong method", status_code=405)
-        
-    fact_data = json.loads(request.body)
-    logger.info("Import body is: %d %s", len(fact_data), type(fact_data))
-    if isinstance(fact_data, dict):
-        fact_data = [fact_data]
+        return HttpResponse("Wrong method", status=405)
+
+    chunks = _chunks(_iter_import_records(request), IMPORT_CHUNK_SIZE)
 
-    for x in fact_data:
-        logger.info("Posting fact: %s", repr(x))
-        resp = post_fact(x)
-        logger.info("Posted fact: %s ==> %s", repr(x), repr(resp))
+    if request.GET.get("async"):
+        # Only staged here; the job queue writes the facts.
+        job = imports.stage_fact_import(request.user, chunks)
+        return HttpResponse(
+            json.dumps({
+                "id": job.uid,
+                "total": job.total,
+                "status_url": request.build_absolute_uri(reverse("quiz:api-import-status", args=[job.uid])),
+            }, indent="  "),
+            content_type = "application/json",
+            status = 202,
+        )
 
-    rv = {"imported": len(fact_data)}
+    rv = {"imported": 0, "unchanged": 0, "new": 0, "updated": 0}
+    for chunk in chunks:
+        counts = post_facts(chunk)
+        rv["imported"] += len(chunk)
+        for k, v in counts.items():
+            rv[k] += v
+    logger.info("Imported facts: %s", rv)
 
     serialized = json.dumps(rv, indent="  ")
 
@@ -140,6 +281,37 @@ def import_facts_view(request):
         content_type = "application/json",
     )
 
+@api_view
+def import_status_view(request, uid):
+    if not request.user.is_staff:
+        return HttpResponse("Permission denied", status=403)
+
+    return HttpResponse(
+        json.dumps(imports.get_import_status(uid), indent="  "),
+        content_type = "application/json",
+    )
+
+@api_view
+@csrf_exempt
+def fact_manifest_view(request):
+    if not request.method == "POST":
+        return HttpResponse("Wrong method", status=405)
+
+    data = json.loads(request.body)
+    if not isinstance(data, dict):
+        raise BadRequest("Expected a JSON object")
+    rv = sync_fact_manifest(
+        request.user,
+        data.get("manifest"),
+        deactivate_absent = bool(data.get("deactivate_absent")),
+        categories = data.get("categories"),
+    )
+
+    return HttpResponse(
+        json.dumps(rv),
+        content_type = "application/json",
+    )
+
 @api_view
 def export_fact_categories_view(request):
     data = export_fact_categories(request.user)
@@ -151,24 +323,24 @@ def export_fact_categories_view(request):
 
 @api_view
 @csrf_exempt
+@transaction.non_atomic_requests
 def import_fact_categories_view(request):
     if not request.user.is_staff:
-        return HttpResponse("Permission denied", status_code=403)
+        return HttpResponse("Permission denied", status=403)
 
     if not request.method == "POST":
-        return HttpResponse("Wrong method", status_code=405)
-        
-    factcat_data = json.loads(request.body)
-    logger.info("Import body is: %d %s", len(factcat_data), type(factcat_data))
-    if isinstance(factcat_data, dict):
-        factcat_data = [factcat_data]
-
-    for x in factcat_data:
-        logger.info("Posting factcat: %s", repr(x))
-        resp = post_fact_category(x)
-        logger.info("Posted factcat: %s ==> %s", repr(x), repr(resp))
-
-    rv = {"imported": len(factcat_data)}
+        return HttpResponse("Wrong method", status=405)
+
+    n = 0
+    for chunk in _chunks(_iter_import_records(request), IMPORT_CHUNK_SIZE):
+        with transaction.atomic():
+            for x in chunk:
+                logger.info("Posting factcat: %s", repr(x))
+                resp = post_fact_category(x)
+                logger.info("Posted factcat: %s ==> %s", repr(x), repr(resp))
+        n += len(chunk)
+
+    rv = {"imported": n}
 
     serialized = json.dumps(rv, indent="  ")
 
@@ -1,10 +1,20 @@
+import gzip
 import json
 import pytest
 
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Fact
+from . import api
+from .. import apitype
+from ..logic import fact_version_hash, post_fact
+from ..models import Fact, FactCategory
 
 from ..testutils import (
     create_superuser,
@@ -77,22 +87,132 @@ class ViewChallengeTest(TestCase):
         assert data["creation_time"] != old_timestamp
         assert data["uid"] != old_uid
 
+def _content(resp):
+    return b"".join(resp.streaming_content)
+
 class FactsListTest(TestCase):
     def setUp(self):
         self.superuser = create_superuser()
         self.client.force_login(self.superuser)
 
+    def _export(self, **kwargs):
+        return json.loads(_content(self.client.get(reverse("quiz:api-facts-export"), **kwargs)))
+
     def test_get_facts_0(self):
-        assert len(self.client.get(reverse("quiz:api-facts-export")).json()) == 0
+        assert len(self._export()) == 0
 
     def test_get_facts_1(self):
         create_numeric_fact()
-        assert len(self.client.get(reverse("quiz:api-facts-export")).json()) == 1
+        assert len(self._export()) == 1
 
     def test_get_facts_2(self):
         create_numeric_fact()
         create_boolean_fact()
-        assert len(self.client.get(reverse("quiz:api-facts-export")).json()) == 2
+        assert len(self._export()) == 2
+
+    def test_export_matches_api_type(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        post_fact({"key": "no-category", "boolean": {"question_text": "Is it?", "correct_answer": False}, "source": "Me"})
+        expected = []
+        for obj in Fact.objects.order_by("pk"):
+            fact = apitype.Fact(
+                key = obj.key,
+                category = obj.category.name if obj.category else None,
+                fine_print = obj.fine_print,
+                source = obj.source,
+                source_link = obj.source_link,
+                **getattr(obj, obj.fact_type + "_fact").export(),
+            )
+            expected.append({k: v for k, v in fact.dict().items() if v})
+        assert self._export() == expected
+
+    def test_export_formats(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        facts = self._export()
+        resp = self.client.get(reverse("quiz:api-facts-export") + "?format=ndjson")
+        assert resp["Content-Type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in _content(resp).splitlines()] == facts
+        resp = self.client.get(reverse("quiz:api-facts-export"), HTTP_ACCEPT="application/x-ndjson", HTTP_ACCEPT_ENCODING="gzip")
+        assert resp["Content-Encoding"] == "gzip"
+        assert [json.loads(line) for line in gzip.decompress(_content(resp)).splitlines()] == facts
+
+    def test_export_is_one_query(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("quiz:api-facts-export"))
+        assert len(json.loads(_content(resp))) == 3
+        tables = ['"quiz_fact"', '"quiz_factcategory"', '"quiz_booleanfact"', '"quiz_numericfact"']
+        assert len([q for q in ctx.captured_queries if any(t in q["sql"] for t in tables)]) == 1
+
+    def _export_through_asgi(self, headers=()):
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from brator.asgi import application
+
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}".encode()
+        communicator = ApplicationCommunicator(application, {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": reverse("quiz:api-facts-export"),
+            "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"cookie", cookie), *headers],
+            "server": ("testserver", 80),
+        })
+
+        async def run():
+            await communicator.send_input({"type": "http.request", "body": b""})
+            start = await communicator.receive_output(10)
+            body = b""
+            while True:
+                message = await communicator.receive_output(10)
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            return start, body
+
+        # Like the test client, keep the handler from closing the test's
+        # database connection.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            return async_to_sync(run)()
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+    def test_export_through_asgi(self):
+        for x in DUMMY_FACT_DATA:
+            post_fact(x)
+        facts = self._export()
+        start, body = self._export_through_asgi()
+        assert start["status"] == 200
+        assert json.loads(body) == facts
+        start, body = self._export_through_asgi([(b"accept-encoding", b"gzip")])
+        assert (b"content-encoding", b"gzip") in [(k.lower(), v) for k, v in start["headers"]]
+        assert json.loads(gzip.decompress(body)) == facts
+
+    def test_export_gzip_negotiation(self):
+        for accept_encoding, gzipped in [
+            ("gzip", True),
+            ("deflate, gzip;q=0.5", True),
+            ("*", True),
+            ("gzip;q=0", False),
+            ("*;q=0", False),
+            ("identity", False),
+            ("", False),
+        ]:
+            resp = self.client.get(reverse("quiz:api-facts-export"), HTTP_ACCEPT_ENCODING=accept_encoding)
+            assert (resp.get("Content-Encoding") == "gzip") == gzipped, accept_encoding
+
+    def test_export_is_staff_only(self):
+        self.client.force_login(create_regular_user())
+        assert self.client.get(reverse("quiz:api-facts-export")).status_code == 403
 
     def test_post_fact(self):
         resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=DUMMY_FACT_DATA[0])
@@ -137,6 +257,12 @@ class FactsListTest(TestCase):
         with pytest.raises(Exception):
             resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=bad_fact)
 
+    def test_post_facts_with_bad_category(self):
+        bad_fact = dict(DUMMY_FACT_DATA[0], category="Bad Category!")
+        with pytest.raises(ValidationError):
+            self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=[DUMMY_FACT_DATA[1], bad_fact])
+        assert not Fact.objects.exists()
+
     def test_post_doubly_bad_fact(self):
         bad_fact = {
             "key": "foo",
@@ -160,12 +286,14 @@ class FactsListTest(TestCase):
     def test_post_all_facts_at_once(self):
         resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=DUMMY_FACT_DATA)
         assert 200 <= resp.status_code <= 399
-        assert resp.json()
+        assert resp.json() == {"imported": 3, "unchanged": 0, "new": 3, "updated": 0}
+        resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=DUMMY_FACT_DATA)
+        assert resp.json() == {"imported": 3, "unchanged": 3, "new": 0, "updated": 0}
 
     def test_get_facts(self):
         resp = self.client.get(reverse("quiz:api-facts-export"))
         assert 200 == resp.status_code
-        assert resp.json() == []
+        assert json.loads(_content(resp)) == []
 
     def test_post_same_fact_twice(self):
         assert Fact.objects.count() == 0
@@ -177,6 +305,112 @@ class FactsListTest(TestCase):
         assert Fact.objects.count() == 2
 
 
+class StreamingImportTest(TestCase):
+    def setUp(self):
+        self.client.force_login(create_superuser())
+
+    def _ndjson(self, records):
+        return "".join(json.dumps(x) + "\n" for x in records).encode()
+
+    def test_ndjson(self):
+        resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/x-ndjson", data=self._ndjson(DUMMY_FACT_DATA))
+        assert resp.json() == {"imported": 3, "unchanged": 0, "new": 3, "updated": 0}
+        assert Fact.objects.count() == 3
+
+    def test_gzip(self):
+        resp = self.client.post(
+            reverse("quiz:api-facts-import"),
+            content_type = "application/x-ndjson",
+            data = gzip.compress(self._ndjson(DUMMY_FACT_DATA)),
+            HTTP_CONTENT_ENCODING = "gzip",
+        )
+        assert resp.json()["new"] == 3
+        resp = self.client.post(
+            reverse("quiz:api-categories-import"),
+            content_type = "application/json",
+            data = gzip.compress(json.dumps([{"name": "a", "weight": 2}, {"name": "b", "weight": 1}]).encode()),
+            HTTP_CONTENT_ENCODING = "gzip",
+        )
+        assert resp.json() == {"imported": 2}
+        assert FactCategory.objects.get(name = "a").weight == 2
+
+    def test_unsupported_encoding(self):
+        resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=b"{}", HTTP_CONTENT_ENCODING="br")
+        assert resp.status_code == 400
+
+    def test_chunks_are_written_separately(self):
+        body = self._ndjson(DUMMY_FACT_DATA) + b"{not json\n"
+        with mock.patch.object(api, "IMPORT_CHUNK_SIZE", 2):
+            resp = self.client.post(reverse("quiz:api-facts-import"), content_type="application/x-ndjson", data=body)
+        assert resp.status_code == 400
+        assert "line 4" in resp.json()["error_message"]
+        assert Fact.objects.count() == 2
+
+class AsyncImportTest(TestCase):
+    def setUp(self):
+        self.client.force_login(create_superuser())
+
+    def test_async_import(self):
+        resp = self.client.post(reverse("quiz:api-facts-import") + "?async=1", content_type="application/json", data=DUMMY_FACT_DATA)
+        assert resp.status_code == 202
+        data = resp.json()
+        assert data["total"] == 3
+        resp = self.client.get(data["status_url"])
+        assert resp.status_code == 200
+        status = resp.json()
+        assert (status["state"], status["processed"], status["new"]) == ("done", 3, 3)
+        assert Fact.objects.count() == 3
+
+    def test_unknown_import(self):
+        resp = self.client.get(reverse("quiz:api-import-status", args=["nope"]))
+        assert resp.status_code == 404
+
+class FactManifestTest(TestCase):
+    def setUp(self):
+        self.client.force_login(create_superuser())
+        self.client.post(reverse("quiz:api-facts-import"), content_type="application/json", data=DUMMY_FACT_DATA[:2])
+
+    def _sync(self, facts, **kwargs):
+        return self.client.post(reverse("quiz:api-facts-manifest"), content_type="application/json", data={
+            "manifest": {x["key"]: fact_version_hash(x) for x in facts},
+            **kwargs,
+        })
+
+    def test_only_missing_or_changed_keys_are_needed(self):
+        changed = dict(DUMMY_FACT_DATA[0], fine_print="Usually.")
+        resp = self._sync([changed, DUMMY_FACT_DATA[1], DUMMY_FACT_DATA[2]])
+        assert resp.status_code == 200
+        assert resp.json() == {"needed": ["human-legs", "spider-legs"], "unchanged": 1, "deactivated": 0}
+        assert Fact.objects.filter(active = True).count() == 2
+
+    def test_deactivate_absent(self):
+        resp = self._sync(DUMMY_FACT_DATA[1:], deactivate_absent=True, categories=["legs-question"])
+        assert resp.json() == {"needed": ["spider-legs"], "unchanged": 1, "deactivated": 1}
+        assert list(Fact.objects.filter(active = True).values_list("key", flat=True)) == ["isaac-18th"]
+        assert FactCategory.objects.get(name = "legs-question").active_fact_count == 0
+
+        resp = self._sync([], deactivate_absent=True, categories=["scientist-question"])
+        assert resp.json()["deactivated"] == 1
+        assert not Fact.objects.filter(active = True).exists()
+
+    def test_deactivate_absent_requires_categories(self):
+        resp = self._sync(DUMMY_FACT_DATA[1:], deactivate_absent=True)
+        assert resp.status_code == 400
+        assert Fact.objects.filter(active = True).count() == 2
+
+    def test_bad_manifest(self):
+        resp = self.client.post(reverse("quiz:api-facts-manifest"), content_type="application/json", data={"manifest": ["human-legs"]})
+        assert resp.status_code == 400
+        for body in [[], "manifest", 3]:
+            resp = self.client.post(reverse("quiz:api-facts-manifest"), content_type="application/json", data=json.dumps(body))
+            assert resp.status_code == 400
+
+    def test_staff_only(self):
+        self.client.force_login(create_regular_user())
+        resp = self._sync(DUMMY_FACT_DATA, deactivate_absent=True)
+        assert resp.status_code == 403
+        assert Fact.objects.filter(active = True).count() == 2
+
 class QuizResponseTest(TestCase):
     def setUp(self):
         self.user = create_regular_user()
@@ -315,6 +549,35 @@ class EvalTest(TestCase):
         assert data[0]["correct"] == True
         assert data[0]["confidence_percent"] == "75.00"
 
+    def test_get_stats(self):
+        create_boolean_fact()
+        for _ in range(6):
+            resp = self.client.get(reverse("quiz:quiz-challenge"))
+            self.client.post(
+                reverse("quiz:quiz-response", args=[resp.json()["uid"]]),
+                content_type="application/json",
+                data={"boolean": {"answer": True, "confidence_percent": 75}},
+            )
+
+        resp = self.client.get(reverse("quiz:eval-stats"))
+        assert 200 == resp.status_code
+        data = resp.json()
+        assert data["total"]["number_of_answers"] == 6
+        assert data["total"]["expected_correct_answers"] == 4.5
+        assert data["total"]["plausibility"]["prob_fewer"] + data["total"]["plausibility"]["prob_more"] < 1
+        assert data["last10"]["number_of_correct_answers"] == data["total"]["number_of_correct_answers"]
+
+        resp = self.client.get(reverse("quiz:eval-calibration-curve"))
+        assert 200 == resp.status_code
+        assert resp.json() == [{
+            "bin_low": 70.0,
+            "bin_high": 80.0,
+            "answers": 6,
+            "correct_answers": 6,
+            "mean_confidence_percent": 75.0,
+            "correct_percent": 100.0,
+        }]
+
 class FactCategoriesListTest(TestCase):
     def setUp(self):
         self.superuser = create_superuser()
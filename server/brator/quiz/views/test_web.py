@@ -3,6 +3,7 @@ from django.urls import reverse
 
 from ..testutils import create_regular_user, create_fact, create_custom_numeric_fact
 
+from ..logic import get_or_create_current_challenge, respond_to_challenge
 from ..models import Challenge, ChallengeFeedback
 
 class IndexTest(TestCase):
@@ -86,12 +87,25 @@ class ChallengeTest(TestCase):
 
 class EvalTest(TestCase):
     def setUp(self):
-        self.client.force_login(create_regular_user())
+        self.user = create_regular_user()
+        self.client.force_login(self.user)
 
     def test_index(self):
         resp = self.client.get(reverse("quiz:web-eval"))
         assert resp.status_code == 200
 
+    def test_charts(self):
+        create_custom_numeric_fact("How many roads must a man walk down?", 42)
+        for _ in range(3):
+            challenge = get_or_create_current_challenge(self.user)
+            respond_to_challenge(self.user, challenge.uid, {
+                "numeric": {"confidence_percent": 80, "ci_low": 40, "ci_high": 45},
+            })
+        resp = self.client.get(reverse("quiz:web-eval"))
+        assert resp.status_code == 200
+        assert b"canvas-chart_calibration_curve" in resp.content
+        assert b"Brier score" in resp.content
+
 class FeedbackTest(TestCase):
     def setUp(self):
         self.client.force_login(create_regular_user())
@@ -100,7 +114,7 @@ class FeedbackTest(TestCase):
             4212345
         )
         self.client.get(reverse("quiz:web-quiz"))
-        self.challenge = Challenge.objects.get()
+        self.challenge = Challenge.objects.get(queued = False)
 
     def test_answer_feedback(self):
         assert ChallengeFeedback.objects.count() == 0
@@ -136,10 +150,10 @@ class DeleteMyAccountTest(TestCase):
             4212345
         )
         self.client.get(reverse("quiz:web-quiz"))
-        self.challenge = Challenge.objects.get()
+        self.challenge = Challenge.objects.get(queued = False)
 
     def test_delete_account(self):
-        assert Challenge.objects.count() == 1
+        assert Challenge.objects.filter(queued = False).count() == 1
         resp = self.client.post(reverse("quiz:web-deleteaccount"), {
             "confirmation_message": "Delete my account. I understand that this action is irreversible.",
         })
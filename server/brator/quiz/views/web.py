@@ -19,6 +19,11 @@ from ..logic import (
     get_largest_standard_summarized_batch_size,
     delete_user_account,
     get_summary_chart_data,
+    get_rolling_chart_data,
+    get_calibration_curve_chart_data,
+    get_calibration_metrics,
+    get_category_eval_stats,
+    get_trend_chart_data,
 )
 from ..models import ChallengeFeedback
 from ..forms import CHALLENGE_FORMS
@@ -140,6 +145,8 @@ def answer_feedback(request, uid):
 def eval_results(request):
     context = get_eval_stats(request.user)
     context["user"] = request.user
+    context["metrics"] = get_calibration_metrics(request.user)
+    context["categories"] = get_category_eval_stats(request.user)
     context["charts"] = [
         {
             "chart_id": f"chart_{bs}",
@@ -147,6 +154,18 @@ def eval_results(request):
         }
         for bs in (20, 50)
     ]
+    context["charts"].append({
+        "chart_id": "chart_rolling",
+        "chart_data": get_rolling_chart_data(request.user),
+    })
+    context["charts"].append({
+        "chart_id": "chart_trend",
+        "chart_data": get_trend_chart_data(request.user),
+    })
+    context["charts"].append({
+        "chart_id": "chart_calibration_curve",
+        "chart_data": get_calibration_curve_chart_data(request.user),
+    })
     return render(request, "quiz/eval.html", context)
 
 @login_required
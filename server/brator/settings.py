@@ -82,6 +82,15 @@ DATABASES = {
     }
 }
 
+# Cached results are keyed on versions of the data they were computed from
+# (see quiz/caching.py), so a cache shared between workers is safe.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("BRATOR_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("BRATOR_CACHE_LOCATION", ""),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -162,6 +171,14 @@ LOGGING = {
 
 LOGIN_REDIRECT_URL = "/"
 
+NO_REPEAT_FACTS = os.environ.get("BRATOR_NO_REPEAT_FACTS", "true").lower() in ("yes", "true")
+
+# Run deferred work (e.g. summaries, imports) immediately instead of queueing
+# it. The Docker image only starts the web server, so this stays on unless
+# BRATOR_JOBS_INLINE=false is set for a deployment that also runs
+# "manage.py run_jobs".
+JOBS_RUN_INLINE = os.environ.get("BRATOR_JOBS_INLINE", "true").lower() in ("yes", "true")
+
 COMPRESS_PRECOMPILERS = [
     ["text/x-scss", "django_libsass.SassCompiler"],
 ]
@@ -2,5 +2,6 @@ import os
 
 os.environ["BRATOR_SECRET_KEY"] = "testkey"
 os.environ["BRATOR_DEBUG"] = "True"
+os.environ["BRATOR_JOBS_INLINE"] = "True"
 
 from .settings import *